@@ -0,0 +1,109 @@
+import os
+import re
+import argparse
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+import main as pipeline
+from metrics import start_run
+from storage import FORMATS, read_movies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge the letterboxd data of many users with data from tmdb.')
+    parser.add_argument('exports', nargs='+', help='letterboxd export folders or zips, one per user')
+    parser.add_argument('--out-dir', default='batch', help='folder in which a folder of generated tables is made per user')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of exports read and saved in parallel')
+    parser.add_argument('--incremental', action='store_true', help='only fetch tmdb data for films new or changed since the last run')
+    parser.add_argument('--resume', action='store_true', help='skip films already fetched by an interrupted run')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='file format of the generated tables')
+    parser.add_argument('--engine', choices=pipeline.ENGINES, default='thread', help='how requests to tmdb are sent')
+    parser.add_argument('--separate-credits', action='store_true', help='fetch credits with their own request instead of along with the details')
+    parser.add_argument('--rps', type=float, default=40, help='requests per second sent by the async engine, retries included')
+    args = parser.parse_args()
+
+    run_batch(
+        args.exports,
+        OUT_DIR=args.out_dir,
+        NUM_PROCESSES=args.processes,
+        INCREMENTAL=args.incremental,
+        RESUME=args.resume,
+        FORMAT=args.format,
+        ENGINE=args.engine,
+        APPEND_CREDITS=not args.separate_credits,
+        REQUESTS_PER_SECOND=args.rps,
+    )
+
+
+def run_batch(
+        EXPORTS: list,
+        OUT_DIR: str = 'batch',
+        NUM_PROCESSES: int = None,
+        INCREMENTAL: bool = False,
+        RESUME: bool = False,
+        FORMAT: str = 'csv',
+        ENGINE: str = 'thread',
+        APPEND_CREDITS: bool = True,
+        REQUESTS_PER_SECOND: float = 40,
+        ):
+    '''
+    Run `process` and `add_tmdb_data` for every letterboxd export in
+    `EXPORTS`, saving the tables of each user to `OUT_DIR/<user>`.
+
+    Exports are read and tables saved by `NUM_PROCESSES` processes in
+    parallel. In between, tmdb data is fetched once per film for all users
+    together, sharing the response cache and id index, and checkpointed to
+    `OUT_DIR` so that an interrupted batch can be resumed with `RESUME`.
+    '''
+
+    users = {user_name(path): path for path in EXPORTS}
+    assert len(users) == len(EXPORTS), 'Every export must belong to a different user!'
+    dirs = {user: os.path.join(OUT_DIR, user) for user in users}
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    metrics = start_run()
+    # Workers are spawned rather than forked, as fetching starts threads
+    with ProcessPoolExecutor(NUM_PROCESSES, mp_context=multiprocessing.get_context('spawn')) as executor:
+        if not RESUME:
+            with metrics.stage('ingest'):
+                futures = [executor.submit(pipeline.process, INCREMENTAL, FORMAT, users[user], dirs[user]) for user in users]
+                for future in tqdm(futures, desc='Reading exports'):
+                    future.result()
+
+        movies = {user: read_movies(dirs[user]) for user in users}
+        pending = pd.concat([df[df['TMDB ID'].isna()] if INCREMENTAL else df for df in movies.values()])
+        jobs = pipeline._plan_jobs(pending)
+        print(f'Fetching {len(jobs)} films for {len(users)} users')
+
+        checkpoint, summary = pipeline.fetch_tmdb_data(jobs, RESUME=RESUME, ENGINE=ENGINE, APPEND_CREDITS=APPEND_CREDITS, DIR=OUT_DIR, REQUESTS_PER_SECOND=REQUESTS_PER_SECOND)
+
+        with metrics.stage('write-back'):
+            results_df = pipeline._make_results_frame(checkpoint.results())
+            futures = [
+                executor.submit(pipeline.save_tmdb_data, df, results_df[results_df['Movie URI'].isin(df['Movie URI'])], INCREMENTAL, FORMAT, dirs[user])
+                for user, df in movies.items()
+            ]
+            for future in tqdm(futures, desc='Saving tables'):
+                future.result()
+            checkpoint.close(REMOVE=True)
+
+    metrics.write_report(os.path.join(OUT_DIR, 'run-report.json'), users=len(users), **summary)
+    print(f'Successfully created tables for {len(users)} users in {OUT_DIR}!')
+
+
+def user_name(path: str) -> str:
+    '''
+    Name the user of the export at `path` after the folder or zip, dropping
+    the `letterboxd-` prefix and export date of zips downloaded from
+    letterboxd.
+    '''
+
+    name = os.path.basename(os.path.normpath(path))
+    name = name[:-len('.zip')] if name.endswith('.zip') else name
+    match = re.fullmatch(r'letterboxd-(.+)-\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-utc', name)
+    return match.group(1) if match else name
+
+
+if __name__ == '__main__':
+    main()
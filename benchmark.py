@@ -0,0 +1,101 @@
+import os
+import argparse
+import csv
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import socket
+import numpy as np
+import main as pipeline
+from metrics import get_metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fetching tmdb data against a local mock tmdb server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 50_000], help='numbers of films to fetch')
+    parser.add_argument('--engine', choices=pipeline.ENGINES, default='thread')
+    parser.add_argument('--separate-credits', action='store_true')
+    parser.add_argument('--rps', type=float, default=40, help='requests per second sent by the async engine')
+    parser.add_argument('--port', type=int, default=8765)
+    args, mock_args = parser.parse_known_args()
+
+    run_benchmark(args.sizes, args.engine, not args.separate_credits, args.port, mock_args, args.rps)
+
+
+def run_benchmark(SIZES: list, ENGINE: str = 'thread', APPEND_CREDITS: bool = True, PORT: int = 8765, MOCK_ARGS: list = None, REQUESTS_PER_SECOND: float = 40):
+    '''
+    Start `mock_tmdb.py` with `MOCK_ARGS` and run `add_tmdb_data` on a
+    synthetic letterboxd export of each of `SIZES` films without the response
+    cache or id index, then print films/sec, p50/p99 latency of the request
+    attempts sent (as recorded in the run metrics, without the waits before
+    and between them) and wall time of each run.
+    '''
+
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_tmdb.py'), '--port', str(PORT), *(MOCK_ARGS or [])])
+    os.environ.setdefault('TMDB_API_ACCESS_TOKEN', 'benchmark')
+    pipeline.TMDB_API_URL = f'http://127.0.0.1:{PORT}/3'
+
+    cwd = os.getcwd()
+    reports = []
+    try:
+        _wait_for_port(PORT)
+        for size in SIZES:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                _make_export(size)
+                pipeline.process()
+                start_time = time.perf_counter()
+                pipeline.add_tmdb_data(USE_CACHE=False, USE_ID_INDEX=False, ENGINE=ENGINE, APPEND_CREDITS=APPEND_CREDITS, REQUESTS_PER_SECOND=REQUESTS_PER_SECOND)
+                elapsed = time.perf_counter() - start_time
+                latencies = get_metrics().latencies()
+                os.chdir(cwd)
+            p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (float('nan'), float('nan'))
+            reports.append((size, size / elapsed, p50, p99, elapsed))
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        server.wait()
+
+    print(f'\nengine={ENGINE}, {"appended" if APPEND_CREDITS else "separate"} credits')
+    print(f'{"films":>8} {"films/sec":>10} {"p50 (ms)":>10} {"p99 (ms)":>10} {"wall (s)":>10}')
+    for size, rate, p50, p99, elapsed in reports:
+        print(f'{size:>8} {rate:>10.2f} {p50 * 1000:>10.1f} {p99 * 1000:>10.1f} {elapsed:>10.2f}')
+
+
+def _make_export(NUM_FILMS: int, SEED: int = 0):
+    '''
+    Write a synthetic letterboxd export of `NUM_FILMS` films to `data/`.
+    '''
+
+    r = random.Random(SEED)
+    os.makedirs('data', exist_ok=True)
+    films = [(f'Film {i}', r.randint(1920, 2024), f'https://boxd.it/b{i}') for i in range(NUM_FILMS)]
+    exports = {
+        'watched.csv': (['Date', 'Name', 'Year', 'Letterboxd URI'], [['2020-01-01', *film] for film in films]),
+        'ratings.csv': (['Date', 'Name', 'Year', 'Letterboxd URI', 'Rating'], [['2020-01-01', *film, r.randint(1, 10) / 2] for film in films if r.random() < 0.8]),
+        'diary.csv': (['Date', 'Name', 'Year', 'Letterboxd URI', 'Rating', 'Rewatch', 'Tags', 'Watched Date'], []),
+        'reviews.csv': (['Date', 'Name', 'Year', 'Letterboxd URI', 'Rating', 'Rewatch', 'Review', 'Tags', 'Watched Date'], []),
+    }
+    for name, (header, rows) in exports.items():
+        with open(os.path.join('data', name), 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def _wait_for_port(PORT: int, TIMEOUT: float = 10):
+    deadline = time.monotonic() + TIMEOUT
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    main()
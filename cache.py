@@ -0,0 +1,124 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+
+CACHE_PATH = os.path.join('cache', 'tmdb.sqlite')
+
+# Seconds a cached response stays fresh, per endpoint type
+DEFAULT_TTL = {
+    'search': 30 * 24 * 60 * 60,
+    'movie': 7 * 24 * 60 * 60,
+    'credits': 30 * 24 * 60 * 60,
+}
+
+
+def endpoint_type(url: str) -> str:
+    '''
+    Classify a tmdb url as one of `search`, `movie` or `credits`.
+    '''
+
+    path = urlparse(url).path
+    if '/search/' in path:
+        return 'search'
+    if path.endswith('/credits'):
+        return 'credits'
+    return 'movie'
+
+
+class ResponseCache:
+    '''
+    Persistent cache of tmdb responses keyed by url and backed by SQLite.
+
+    Entries older than the TTL of their endpoint type are treated as misses and
+    dropped on `evict()`, which also removes the least recently used entries
+    once the cache holds more than `MAX_ENTRIES` responses.
+    '''
+
+    def __init__(self, path: str = CACHE_PATH, ttl: dict = None, MAX_ENTRIES: int = 250_000, COMMIT_EVERY: int = 100):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = {**DEFAULT_TTL, **(ttl or {})}
+        self.max_entries = MAX_ENTRIES
+        self.commit_every = COMMIT_EVERY
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                body TEXT NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+        self.evict()
+
+    def get(self, url: str) -> dict | None:
+        '''
+        Return the cached response for `url`, or None if missing or stale.
+        '''
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT endpoint, fetched_at, body FROM responses WHERE url = ?', (url,)).fetchone()
+            if row is None or now - row[1] > self.ttl[row[0]]:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (now, url))
+            self._tick()
+            self.hits += 1
+        return json.loads(row[2])
+
+    def put(self, url: str, data: dict):
+        '''
+        Store the response `data` for `url`.
+        '''
+
+        now = time.time()
+        body = json.dumps(data, separators=(',', ':'))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (url, endpoint, fetched_at, accessed_at, body) VALUES (?, ?, ?, ?, ?)',
+                (url, endpoint_type(url), now, now, body)
+            )
+            self._tick()
+
+    def evict(self):
+        '''
+        Drop stale entries, then the least recently used ones above `MAX_ENTRIES`.
+        '''
+
+        now = time.time()
+        with self._lock:
+            for endpoint, ttl in self.ttl.items():
+                self._conn.execute('DELETE FROM responses WHERE endpoint = ? AND fetched_at < ?', (endpoint, now - ttl))
+            self._conn.execute('''
+                DELETE FROM responses WHERE url IN (
+                    SELECT url FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._conn.commit()
+            self._pending = 0
@@ -0,0 +1,77 @@
+import os
+import json
+
+
+CHECKPOINT_PATH = os.path.join('generated', 'checkpoint.jsonl')
+
+
+class Checkpoint:
+    '''
+    Append-only log of fetched results, one JSON object per line, so that an
+    interrupted run can be resumed without fetching finished films again.
+    Unless `RESUME`, results of a previous run are discarded.
+    '''
+
+    def __init__(self, path: str = CHECKPOINT_PATH, RESUME: bool = False):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not RESUME and os.path.exists(path):
+            os.remove(path)
+        self._repair()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def completed(self) -> set:
+        '''
+        Return the `Movie URI` of every film fetched successfully so far.
+        '''
+
+        return {res['Movie URI'] for res in self.results() if res['Ok']}
+
+    def append(self, result: dict):
+        '''
+        Save `result` to the end of the checkpoint.
+        '''
+
+        self._file.write(json.dumps(result, separators=(',', ':')) + '\n')
+        self._file.flush()
+
+    def results(self):
+        '''
+        Iterate over the saved results, oldest first.
+        '''
+
+        self._file.flush()
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                yield json.loads(line)
+
+    def close(self, REMOVE: bool = False):
+        '''
+        Close the checkpoint, deleting it if `REMOVE`.
+        '''
+
+        self._file.close()
+        if REMOVE:
+            os.remove(self.path)
+
+    def _repair(self):
+        '''
+        Drop a last line left incomplete by a crash.
+        '''
+
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as file:
+            end = file.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                start = max(0, pos - 65536)
+                file.seek(start)
+                chunk = file.read(pos - start)
+                if b'\n' in chunk:
+                    pos = start + chunk.rfind(b'\n') + 1
+                    break
+                pos = start
+            if pos != end:
+                file.truncate(pos)
@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from tqdm import tqdm
+
+
+class TokenBucket:
+    '''
+    Rate limiter allowing `RATE` acquisitions per second on average, with
+    bursts of up to `CAPACITY`.
+    '''
+
+    def __init__(self, RATE: float, CAPACITY: float = None):
+        self.rate = RATE
+        self.capacity = CAPACITY if CAPACITY is not None else max(1.0, RATE)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        '''
+        Wait until a token is available and take it.
+        '''
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveConcurrency:
+    '''
+    Limit on the number of requests in flight that adapts AIMD-style: it grows
+    by about one for every `limit` requests that succeed within
+    `LATENCY_TARGET` seconds, and is multiplied by `DECREASE` (at most once per
+    `COOLDOWN` seconds) when a request is throttled, fails or is slow. Safe to
+    share between threads.
+    '''
+
+    def __init__(
+            self,
+            INITIAL: float = 8,
+            MINIMUM: float = 1,
+            MAXIMUM: float = 64,
+            LATENCY_TARGET: float = 2.0,
+            DECREASE: float = 0.5,
+            COOLDOWN: float = 1.0,
+            ):
+        self.limit = min(max(INITIAL, MINIMUM), MAXIMUM)
+        self.minimum = MINIMUM
+        self.maximum = MAXIMUM
+        self.latency_target = LATENCY_TARGET
+        self.decrease = DECREASE
+        self.cooldown = COOLDOWN
+        self.in_flight = 0
+        self.congestion_events = 0
+        self._decreased_at = float('-inf')
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        '''
+        Wait until fewer than `limit` requests are in flight and count one more.
+        '''
+
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, CONGESTED: bool = False):
+        '''
+        Count a finished request that took `latency` seconds and adapt the limit.
+        '''
+
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if CONGESTED or latency > self.latency_target:
+                self.congestion_events += 1
+                if now - self._decreased_at >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._decreased_at = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+def fetch_async(
+        jobs: list,
+        process_job,
+        send,
+        on_result,
+        cache = None,
+        REQUESTS_PER_SECOND: float = 40,
+        MAX_IN_FLIGHT: int = 1000,
+        NUM_WORKERS: int = 64,
+        waiting = None,
+        ):
+    '''
+    Run the coroutine `process_job(job, fetch)` for every job and pass each
+    result to `on_result` as soon as it is ready. `fetch(url)` resolves `url`
+    from `cache` if possible, otherwise it waits for the shared token bucket and
+    calls the blocking `send(url, acquire)` on a pool of `NUM_WORKERS` threads.
+    `send` must call `acquire()` before every retry of the request, so that
+    retries are held to the `REQUESTS_PER_SECOND` budget as well. At most
+    `MAX_IN_FLIGHT` jobs are in progress at a time.
+
+    If given, `waiting('bucket')` is entered around each wait for the bucket,
+    e.g. to time it. `send` runs in a copy of the context of its `fetch`.
+    '''
+
+    asyncio.run(_fetch_async(jobs, process_job, send, on_result, cache, REQUESTS_PER_SECOND, MAX_IN_FLIGHT, NUM_WORKERS, waiting))
+
+
+async def _fetch_async(jobs, process_job, send, on_result, cache, REQUESTS_PER_SECOND, MAX_IN_FLIGHT, NUM_WORKERS, waiting):
+    loop = asyncio.get_running_loop()
+    bucket = TokenBucket(REQUESTS_PER_SECOND)
+    pending = iter(jobs)
+
+    def acquire():
+        # Blocks a sending thread until the event loop hands out a token
+        asyncio.run_coroutine_threadsafe(bucket.acquire(), loop).result()
+
+    with ThreadPoolExecutor(max_workers=NUM_WORKERS) as executor, tqdm(total=len(jobs), desc='Fetching movie data') as progress:
+
+        async def fetch(url: str) -> dict | None:
+            if cache is not None:
+                data = cache.get(url)
+                if data is not None:
+                    return data
+            with waiting('bucket') if waiting is not None else nullcontext():
+                await bucket.acquire()
+            data = await loop.run_in_executor(executor, contextvars.copy_context().run, send, url, acquire)
+            if cache is not None and data is not None:
+                cache.put(url, data)
+            return data
+
+        async def worker():
+            for job in pending:
+                on_result(await process_job(job, fetch))
+                progress.update()
+
+        await asyncio.gather(*[worker() for _ in range(min(MAX_IN_FLIGHT, len(jobs)))])
@@ -0,0 +1,108 @@
+import os
+import gzip
+import json
+import sqlite3
+import threading
+
+
+IDS_PATH = os.path.join('cache', 'ids.sqlite')
+
+
+class IdIndex:
+    '''
+    Persistent index resolving letterboxd films to tmdb ids without a search
+    request, backed by SQLite.
+
+    Films are looked up by `Movie URI` among the ids found by earlier runs,
+    then by title among the films of an imported tmdb id export, which is only
+    trusted if exactly one film has that title.
+    '''
+
+    def __init__(self, path: str = IDS_PATH, COMMIT_EVERY: int = 100):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.commit_every = COMMIT_EVERY
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS films (
+                uri TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                year INTEGER,
+                tmdb_id INTEGER NOT NULL
+            )
+        ''')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS titles (
+                title TEXT NOT NULL,
+                tmdb_id INTEGER NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS titles_title ON titles (title)')
+        self._conn.commit()
+
+    def get(self, uri: str, name: str) -> int | None:
+        '''
+        Return the tmdb id of the film at `uri` named `name`, or None if it
+        cannot be resolved locally.
+        '''
+
+        with self._lock:
+            row = self._conn.execute('SELECT tmdb_id FROM films WHERE uri = ?', (uri,)).fetchone()
+            if row is not None:
+                return row[0]
+            rows = self._conn.execute('SELECT DISTINCT tmdb_id FROM titles WHERE title = ? LIMIT 2', (_normalize(name),)).fetchall()
+        return rows[0][0] if len(rows) == 1 else None
+
+    def put(self, uri: str, name: str, year: int, tmdb_id: int):
+        '''
+        Remember that the film at `uri` has the tmdb id `tmdb_id`.
+        '''
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO films (uri, name, year, tmdb_id) VALUES (?, ?, ?, ?)',
+                (uri, name, year, tmdb_id)
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._conn.commit()
+                self._pending = 0
+
+    def import_export(self, path: str, BATCH_SIZE: int = 10_000) -> int:
+        '''
+        Replace the titles of the index with those of a tmdb daily movie id
+        export, a gzip file of one JSON object per line, skipping adult films
+        and videos. Return the number of titles imported.
+        '''
+
+        count = 0
+        with self._lock, gzip.open(path, 'rt', encoding='utf-8') as file:
+            self._conn.execute('DELETE FROM titles')
+            batch = []
+            for line in file:
+                movie = json.loads(line)
+                if movie.get('adult') or movie.get('video'):
+                    continue
+                batch.append((_normalize(movie['original_title']), movie['id']))
+                if len(batch) >= BATCH_SIZE:
+                    self._conn.executemany('INSERT INTO titles (title, tmdb_id) VALUES (?, ?)', batch)
+                    count += len(batch)
+                    batch = []
+            self._conn.executemany('INSERT INTO titles (title, tmdb_id) VALUES (?, ?)', batch)
+            count += len(batch)
+            self._conn.commit()
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def _normalize(title: str) -> str:
+    return ' '.join(str(title).casefold().split())
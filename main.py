@@ -1,31 +1,102 @@
 import os
+import argparse
+import random
 import pandas as pd
 import requests
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from multiprocessing import Manager
+import zipfile
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from tqdm import tqdm
-
-
-search_url = lambda name, year: f'https://api.themoviedb.org/3/search/movie?query={name}&year={year}&page=1'
-movie_url = lambda tmdb_id: f'https://api.themoviedb.org/3/movie/{tmdb_id}'
-credits_url = lambda tmdb_id: f'https://api.themoviedb.org/3/movie/{tmdb_id}/credits'
+from cache import ResponseCache, endpoint_type
+from checkpoint import Checkpoint
+from ids import IdIndex
+from engine import fetch_async
+from metrics import start_run, get_metrics
+from session import open_session, get_session, get_limiter, connection_stats
+from storage import FORMATS, read_movies, write_movies, read_credits, write_credits, write_people, write_bridge_tables, table_exists
+
+
+# Can point at a stand-in server such as `mock_tmdb.py`
+TMDB_API_URL = os.environ.get('TMDB_API_URL', 'https://api.themoviedb.org/3')
+
+search_url = lambda name, year: f'{TMDB_API_URL}/search/movie?query={name}&year={year}&page=1'
+movie_url = lambda tmdb_id: f'{TMDB_API_URL}/movie/{tmdb_id}'
+movie_credits_url = lambda tmdb_id: f'{TMDB_API_URL}/movie/{tmdb_id}?append_to_response=credits'
+credits_url = lambda tmdb_id: f'{TMDB_API_URL}/movie/{tmdb_id}/credits'
+
+# Columns of the movies table filled in by `add_tmdb_data`
+TMDB_COLUMNS = [
+    'TMDB ID',
+    'Runtime',
+    'Countries',
+    'Genres',
+    'Languages',
+    'Average Rating',
+    'Popularity',
+    'Poster URI',
+    'Directors',
+    'Actors',
+]
+
+# Columns read from each letterboxd file, leaving out long texts such as reviews
+EXPORT_COLUMNS = {
+    'watched.csv': ['Date', 'Name', 'Year', 'Letterboxd URI'],
+    'ratings.csv': ['Letterboxd URI', 'Rating'],
+    'diary.csv': ['Name', 'Year', 'Letterboxd URI', 'Rewatch', 'Tags', 'Watched Date'],
+    'reviews.csv': ['Name', 'Year'],
+}
+
+ENGINES = ('thread', 'async')
+
+# Responses worth retrying, as the request may succeed later
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 
 def main():
-    process()
-    add_tmdb_data()
-
-
-def process():
+    parser = argparse.ArgumentParser(description='Merge letterboxd data with data from tmdb.')
+    parser.add_argument('--incremental', action='store_true', help='only fetch tmdb data for films new or changed since the last run')
+    parser.add_argument('--resume', action='store_true', help='skip films already fetched by an interrupted run')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='file format of the generated movies and credits tables')
+    parser.add_argument('--engine', choices=ENGINES, default='thread', help='how requests to tmdb are sent')
+    parser.add_argument('--separate-credits', action='store_true', help='fetch credits with their own request instead of along with the details')
+    parser.add_argument('--rps', type=float, default=40, help='requests per second sent by the async engine, retries included')
+    parser.add_argument('--compare-engines', type=int, metavar='LIMIT', help='only compare the throughput of the engines on the first LIMIT films')
+    parser.add_argument('--import-ids', metavar='PATH', help='only import a tmdb daily movie id export (.json.gz) into the local id index')
+    parser.add_argument('--data', default='data', help='letterboxd export folder or zip')
+    parser.add_argument('--out-dir', default='generated', help='folder of the generated tables')
+    args = parser.parse_args()
+
+    if args.import_ids:
+        index = IdIndex()
+        print(f'Imported {index.import_export(args.import_ids)} titles into the id index')
+        index.close()
+        return
+
+    if args.compare_engines:
+        compare_engines(args.compare_engines, REQUESTS_PER_SECOND=args.rps, DIR=args.out_dir)
+        return
+
+    if not args.resume:
+        process(INCREMENTAL=args.incremental, FORMAT=args.format, DATA=args.data, DIR=args.out_dir)
+    add_tmdb_data(INCREMENTAL=args.incremental, RESUME=args.resume, ENGINE=args.engine, FORMAT=args.format, APPEND_CREDITS=not args.separate_credits, DIR=args.out_dir, REQUESTS_PER_SECOND=args.rps)
+
+
+def process(INCREMENTAL: bool = False, FORMAT: str = 'csv', DATA: str = 'data', DIR: str = 'generated', CHUNK_SIZE: int = 10_000):
     '''
-    Read and combine data from exported letterboxd data.
+    Read and combine data from exported letterboxd data in `DATA`, a folder or
+    the export zip, and save it as `movies.{FORMAT}` in `DIR`. If
+    `INCREMENTAL`, tmdb data of films already in a previously generated movies
+    table is kept so only new or changed films need to be fetched again.
+
+    Files are streamed `CHUNK_SIZE` rows at a time and only the columns in
+    `EXPORT_COLUMNS` are kept, so review texts are never held in memory. The
+    rows of watched, ratings and diary files all end up in the movies table
+    and are kept whole, but reviews are reduced to the films they match.
     '''
 
-    watched_df = pd.read_csv(os.path.join('data', 'watched.csv'))
-    ratings_df = pd.read_csv(os.path.join('data', 'ratings.csv'))
-    diary_df = pd.read_csv(os.path.join('data', 'diary.csv'))
-    reviews_df = pd.read_csv(os.path.join('data', 'reviews.csv'))
+    watched_df = _read_export(DATA, 'watched.csv', CHUNK_SIZE)
 
     columns = [
         'Rated',
@@ -44,6 +115,7 @@ def process():
         'Poster URI',
         'Directors',
         'Actors',
+        'TMDB ID',
         # 'Num Reviews',
         # 'Review',
     ]
@@ -55,181 +127,689 @@ def process():
     movies_df['Name'] = watched_df['Name']
     movies_df['Year'] = watched_df['Year']
     movies_df['Movie URI'] = watched_df['Letterboxd URI']
+    lookup = movies_df[['Name', 'Year', 'Movie URI']].drop_duplicates(subset=['Name', 'Year'])
+    del watched_df
 
     # Add data from ratings.csv
-    ratings_df = ratings_df.rename(columns={'Letterboxd URI': 'Movie URI'})
+    ratings_df = _read_export(DATA, 'ratings.csv', CHUNK_SIZE).rename(columns={'Letterboxd URI': 'Movie URI'})
     movies_df['Rated'] = movies_df['Movie URI'].isin(ratings_df['Movie URI'].tolist())
     movies_df = movies_df.merge(ratings_df[['Rating', 'Movie URI']], how='left', on='Movie URI')
 
     # Add date from diary.csv
-    diary_df = diary_df.rename(columns={'Letterboxd URI': 'Diary URI'})
-    diary_df['Movie URI'] = [movies_df[(movies_df['Name'] == r['Name']) & (movies_df['Year'] == r['Year'])]['Movie URI'].head(1).item() for _,r in diary_df.iterrows()]
+    diary_df = _read_export(DATA, 'diary.csv', CHUNK_SIZE, lambda chunk: _match_movie_uri(chunk.rename(columns={'Letterboxd URI': 'Diary URI'}), lookup))
     movies_df['Logged'] = movies_df['Movie URI'].isin(diary_df['Movie URI'].tolist())
     movies_df = movies_df.merge(diary_df[['Rewatch', 'Tags', 'Watched Date', 'Diary URI', 'Movie URI']], how='left', on='Movie URI')
 
     # Add data from reviews.csv
-    reviews_df['Movie URI'] = [movies_df[(movies_df['Name'] == r['Name']) & (movies_df['Year'] == r['Year'])]['Movie URI'].head(1).item() for _,r in reviews_df.iterrows()]
+    reviews_df = _read_export(DATA, 'reviews.csv', CHUNK_SIZE, lambda chunk: _keep_matched_uris(_match_movie_uri(chunk, lookup)))
     movies_df['Reviewed'] = movies_df['Movie URI'].isin(reviews_df['Movie URI'].tolist())
+
+    os.makedirs(DIR, exist_ok=True)
+    _report_unmatched({'diary.csv': diary_df, 'reviews.csv': reviews_df}, DIR)
     
+    # Reuse tmdb data from the previous run
+    if INCREMENTAL and table_exists('movies', DIR):
+        movies_df = _carry_over_tmdb_data(movies_df, read_movies(DIR))
+
     # Save
-    os.mkdir('generated')
-    movies_df.to_csv(os.path.join('generated', 'movies.csv'), index=False)
-    print('Successfully created movies.csv!')
+    write_movies(movies_df, FORMAT, DIR)
+    print(f'Successfully created movies.{FORMAT}!')
+
+
+def _read_export(DATA: str, name: str, CHUNK_SIZE: int = 10_000, transform = None) -> pd.DataFrame:
+    '''
+    Read the `EXPORT_COLUMNS` of the letterboxd file `name` from `DATA`, an
+    export folder or zip, `CHUNK_SIZE` rows at a time, and combine the chunks
+    after applying `transform` to each of them. Zips are read without
+    extracting them.
+    '''
+
+    transform = transform or (lambda chunk: chunk)
+    if not zipfile.is_zipfile(DATA):
+        with pd.read_csv(os.path.join(DATA, name), usecols=EXPORT_COLUMNS[name], chunksize=CHUNK_SIZE) as reader:
+            return pd.concat([transform(chunk) for chunk in reader], ignore_index=True)
+    with zipfile.ZipFile(DATA) as archive, archive.open(name) as file:
+        with pd.read_csv(file, usecols=EXPORT_COLUMNS[name], chunksize=CHUNK_SIZE) as reader:
+            return pd.concat([transform(chunk) for chunk in reader], ignore_index=True)
+
+
+def _match_movie_uri(df: pd.DataFrame, lookup: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Add the `Movie URI` of the movie in `lookup` (one row per `Name` and
+    `Year`) with the same `Name` and `Year` to every row of `df`. Rows without
+    a match are left empty.
+    '''
+
+    return df.merge(lookup, how='left', on=['Name', 'Year'])
+
+
+def _keep_matched_uris(df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Reduce the rows of `df` matched to a movie to one per `Movie URI`,
+    keeping the unmatched rows for `_report_unmatched`.
+    '''
+
+    matched = df['Movie URI'].notna()
+    return pd.concat([df[matched].drop_duplicates(subset=['Movie URI']), df[~matched]], ignore_index=True)
+
+
+def _report_unmatched(sources: dict, DIR: str = 'generated'):
+    '''
+    Save the rows of each letterboxd file in `sources` that could not be
+    matched to a watched movie to `unmatched.csv` in `DIR`.
+    '''
+
+    unmatched = pd.concat([df[df['Movie URI'].isna()][['Name', 'Year']].assign(Source=name) for name, df in sources.items()])
+    unmatched[['Source', 'Name', 'Year']].to_csv(os.path.join(DIR, 'unmatched.csv'), index=False)
+    for name in sources:
+        print(f'# unmatched rows in {name}: {(unmatched["Source"] == name).sum()}')
+
+
+def _carry_over_tmdb_data(movies_df: pd.DataFrame, previous_df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Copy tmdb data from `previous_df` to the rows of `movies_df` with the same
+    `Movie URI`, `Name` and `Year`. Films that are new, changed or failed to
+    fetch last time are left empty.
+    '''
+
+    if 'TMDB ID' not in previous_df.columns:
+        return movies_df
+
+    previous = previous_df.dropna(subset=['TMDB ID']).drop_duplicates(subset=['Movie URI'])
+    previous = previous[['Movie URI', 'Name', 'Year', *TMDB_COLUMNS]]
+    merged = movies_df.drop(columns=TMDB_COLUMNS).merge(previous, how='left', on=['Movie URI', 'Name', 'Year'])
+    print(f'Reusing tmdb data for {merged["TMDB ID"].notna().sum()} of {len(merged)} rows')
+    return merged[movies_df.columns]
+
+
+def add_tmdb_data(
+        NUM_THREADS:int = 10,
+        USE_CACHE: bool = True,
+        INCREMENTAL: bool = False,
+        RESUME: bool = False,
+        ENGINE: str = 'thread',
+        POOL_SIZE: int = 64,
+        KEEP_ALIVE: bool = True,
+        FORMAT: str = 'csv',
+        APPEND_CREDITS: bool = True,
+        USE_ID_INDEX: bool = True,
+        DIR: str = 'generated',
+        REQUESTS_PER_SECOND: float = 40,
+        ):
+    '''
+    Add additional data from tmdb to the movies table in `DIR` and save it,
+    along with the credits table, as `{FORMAT}` files. Responses are read from
+    and saved to the on-disk response cache unless `USE_CACHE` is False. If
+    `INCREMENTAL`, only rows without tmdb data are fetched and the credits
+    table is extended instead of rebuilt. `ENGINE` is one of `ENGINES` (see
+    `_fetch_jobs`), the `async` one sending at most `REQUESTS_PER_SECOND`
+    requests per second. Requests share a session keeping up to `POOL_SIZE`
+    connections alive. Credits are fetched along with the details unless
+    `APPEND_CREDITS` is False. Unless `USE_ID_INDEX` is False, films whose
+    tmdb id is in the local id index skip the search request.
+
+    Results are streamed to `checkpoint.jsonl` as they arrive and read back
+    from there when saving. If `RESUME`, films already in the checkpoint of an
+    interrupted run are not fetched again.
+
+    Request, stage, worker and queue metrics of the run are saved to
+    `run-report.json`.
+    '''
 
+    metrics = start_run()
+    movies = read_movies(DIR)
+    # movies = movies.head(100) # Limit jobs for debugging
 
-def add_tmdb_data(NUM_THREADS:int = 10):
+    pending = movies[movies['TMDB ID'].isna()] if INCREMENTAL else movies
+    jobs = _plan_jobs(pending)
+    print(f'Fetching {len(jobs)} films for {len(pending)} {"new or changed " if INCREMENTAL else ""}rows')
+
+    checkpoint, summary = fetch_tmdb_data(jobs, NUM_THREADS, USE_CACHE, RESUME, ENGINE, POOL_SIZE, KEEP_ALIVE, APPEND_CREDITS, USE_ID_INDEX, DIR, REQUESTS_PER_SECOND)
+
+    with metrics.stage('write-back'):
+        save_tmdb_data(movies, _make_results_frame(checkpoint.results()), INCREMENTAL, FORMAT, DIR)
+        checkpoint.close(REMOVE=True)
+
+    metrics.write_report(os.path.join(DIR, 'run-report.json'), **summary)
+    print('Successfully created run-report.json!')
+
+
+def fetch_tmdb_data(
+        jobs: list,
+        NUM_THREADS: int = 10,
+        USE_CACHE: bool = True,
+        RESUME: bool = False,
+        ENGINE: str = 'thread',
+        POOL_SIZE: int = 64,
+        KEEP_ALIVE: bool = True,
+        APPEND_CREDITS: bool = True,
+        USE_ID_INDEX: bool = True,
+        DIR: str = 'generated',
+        REQUESTS_PER_SECOND: float = 40,
+        ) -> tuple:
     '''
-    Add additional data from tmdb to `movies.csv`.
+    Fetch the tmdb data of every job (see `_plan_jobs`) into the checkpoint in
+    `DIR`, and return the checkpoint along with a summary of the run for the
+    run report. See `add_tmdb_data` for the options.
     '''
 
     start_time = time.time()
     print('Fetching movie data...')
 
-    def process_job(job: dict, results_queue):
-        name, year = job['Name'], job['Year']
-        details = _get_movie_details(name, year)
-        credits = _get_movie_credits(details['tmdb_id']) if details is not None else None
-        if details is not None and credits is not None:
-            results_queue.append({'Ok': True, 'Name': name, 'Year': year, 'Details': details, 'Credits': credits})
-        else:
-            results_queue.append({'Ok': False, 'Name': name, 'Year': year, 'Details': details, 'Credits': credits})
-        
-    movies = pd.read_csv(os.path.join('generated', 'movies.csv'))
-    # movies = movies.head(100) # Limit jobs for debugging
+    metrics = get_metrics()
+    cache = ResponseCache() if USE_CACHE else None
+    open_session(POOL_SIZE, KEEP_ALIVE)
+    num_jobs = len(jobs)
+
+    checkpoint = Checkpoint(os.path.join(DIR, 'checkpoint.jsonl'), RESUME=RESUME)
+    if RESUME:
+        completed = checkpoint.completed()
+        jobs = [job for job in jobs if job['Movie URI'] not in completed]
+        print(f'Resuming with {len(completed)} films already fetched, {len(jobs)} left')
+
+    index = IdIndex() if USE_ID_INDEX else None
+    if index is not None:
+        for job in jobs:
+            job['TMDB ID'] = index.get(job['Movie URI'], job['Name'])
+        print(f'Resolved {len([job for job in jobs if job["TMDB ID"] is not None])} of {len(jobs)} tmdb ids locally')
+
+    counts = {'Ok': 0, 'Failed': 0}
+    def on_result(res: dict):
+        checkpoint.append(res)
+        counts['Ok' if res['Ok'] else 'Failed'] += 1
+        if index is not None and res['Ok']:
+            index.put(res['Movie URI'], res['Name'], res['Year'], res['Details']['tmdb_id'])
+
+    limiter = get_limiter()
+    metrics.start_sampling(lambda: {'in_flight_requests': limiter.in_flight, 'concurrency_limit': round(limiter.limit, 2)})
+    _fetch_jobs(jobs, on_result, ENGINE, NUM_THREADS, cache, APPEND_CREDITS, REQUESTS_PER_SECOND=REQUESTS_PER_SECOND)
+    metrics.stop_sampling()
+
+    # After completed
+    print(f'\nCompleted in {round(time.time() - start_time, 3)} seconds')
+    print(f'# successes: {counts["Ok"]}')
+    print(f'# failures: {counts["Failed"]}')
+    if cache is not None:
+        print(f'# cache hits: {cache.hits}')
+        print(f'# cache misses: {cache.misses}')
+        cache.close()
+    if index is not None:
+        index.close()
+    conn = connection_stats()
+    print(f'# connections opened: {conn["Connections"]} for {conn["Requests"]} requests ({conn["Reused"]} reused)')
+    print(f'# throttled or failed requests: {limiter.congestion_events} (final concurrency limit {round(limiter.limit, 1)})')
+
+    summary = {
+        'engine': ENGINE,
+        'films': {'jobs': num_jobs, 'ok': counts['Ok'], 'failed': counts['Failed']},
+        'cache': {'hits': cache.hits, 'misses': cache.misses} if cache is not None else None,
+        'connections': conn,
+        'limiter': {'congestion_events': limiter.congestion_events, 'final_limit': round(limiter.limit, 2)},
+    }
+    return checkpoint, summary
+
+
+def save_tmdb_data(movies: pd.DataFrame, results_df: pd.DataFrame, INCREMENTAL: bool = False, FORMAT: str = 'csv', DIR: str = 'generated'):
+    '''
+    Fill in the tmdb columns of `movies` from `results_df` (see
+    `_make_results_frame`) and save the movies, credits and bridge tables to
+    `DIR`. If `INCREMENTAL`, the previous credits table is extended.
+    '''
+
+    # Save credits data
+    credits_df = _make_credits_frame(results_df)
+    if INCREMENTAL and table_exists('credits', DIR):
+        credits_df = pd.concat([read_credits(DIR).astype({'category': 'object'}), credits_df], ignore_index=True)
+    credits_df = credits_df.drop_duplicates()
+    write_credits(credits_df, FORMAT, DIR)
+    write_people(credits_df, DIR)
+    print(f'Successfully created credits.{FORMAT}!')
+
+    # Save details data
+    movies = movies.astype({'Poster URI': 'object', 'Countries': 'object', 'Genres': 'object', 'Languages': 'object', 'Directors': 'object', 'Actors': 'object'})
+    merged = movies[['Movie URI']].merge(_make_details_frame(results_df), how='left', on='Movie URI', indicator=True)
+    selection = (merged['_merge'] == 'both').to_numpy()
+    for column in TMDB_COLUMNS:
+        movies.loc[selection, column] = merged.loc[selection, column].to_numpy()
+    movies['Runtime'] = movies['Runtime'].fillna(0)
+
+    write_movies(movies, FORMAT, DIR)
+    print(f'Successfully updated movies.{FORMAT}!')
+
+    # Save one row per film and genre, country, language or person
+    write_bridge_tables(movies, FORMAT, DIR)
+    print('Successfully created bridge tables!')
+
+
+def _make_results_frame(results) -> pd.DataFrame:
+    '''
+    Collect the successful results into one row per film, keeping the latest
+    result of films fetched more than once.
+    '''
+
+    columns = ['Movie URI', 'Details', 'Credits']
+    data_dict = {c: [] for c in columns}
+    for res in results:
+        if res['Ok']:
+            for c in columns:
+                data_dict[c].append(res[c])
+    return pd.DataFrame(data_dict).drop_duplicates(subset=['Movie URI'], keep='last')
+
+
+def _make_details_frame(results_df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Make the tmdb columns of the movies table for every film in `results_df`.
+    '''
+
+    if results_df.empty:
+        return pd.DataFrame(columns=['Movie URI', *TMDB_COLUMNS])
+
+    details = pd.DataFrame(results_df['Details'].tolist())
+    credits = pd.DataFrame(results_df['Credits'].tolist())
+    ids = lambda people: [x['id'] for x in people]
+    return pd.DataFrame({
+        'Movie URI': results_df['Movie URI'].to_numpy(),
+        'TMDB ID': details['tmdb_id'],
+        'Runtime': details['Runtime'].fillna(0),
+        'Countries': details['Countries'],
+        'Genres': details['Genres'],
+        'Languages': details['Languages'],
+        'Average Rating': details['Vote Average'],
+        'Popularity': details['Popularity'],
+        'Poster URI': details['Poster Path'],
+        'Directors': credits['Directors'].map(ids),
+        'Actors': credits['Actors'].map(ids),
+    })
+
+
+def _make_credits_frame(results_df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Make one row of the credits table per director and actor credited in `results_df`.
+    '''
+
+    columns = ['id', 'category', 'name', 'profile_path']
+    if results_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    credits = pd.DataFrame(results_df['Credits'].tolist())
+    frames = []
+    for category in ('Directors', 'Actors'):
+        people = credits[category].explode().dropna()
+        frames.append(pd.DataFrame(people.tolist(), columns=['id', 'name', 'profile_path']).assign(category=category))
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def _plan_jobs(movies: pd.DataFrame) -> list:
+    '''
+    Make one job per film in `movies`, so films logged several times are only
+    fetched once.
+    '''
+
+    films = movies.drop_duplicates(subset=['Movie URI'])
+    return films[['Movie URI', 'Name', 'Year']].to_dict('records')
+
+
+def _fetch_jobs(
+        jobs: list,
+        on_result,
+        ENGINE: str = 'thread',
+        NUM_THREADS: int = 10,
+        cache: ResponseCache | None = None,
+        APPEND_CREDITS: bool = True,
+        MAX_PENDING_PER_THREAD: int = 4,
+        NUM_WORKERS: int = 64,
+        REQUESTS_PER_SECOND: float = 40,
+        ):
+    '''
+    Fetch tmdb data for every job and pass each result to `on_result` as soon
+    as it is ready. The `thread` engine runs each job on one of `NUM_THREADS`
+    threads, the `async` engine pipelines jobs on an event loop limited by a
+    shared token bucket of `REQUESTS_PER_SECOND`, retries included, instead of
+    sleeping before each request, and sends them from `NUM_WORKERS` threads.
+    Neither keeps more than a bounded number of jobs in progress.
+    '''
 
-    jobs = [{'Name': m['Name'], 'Year': m['Year']} for _,m in movies.iterrows()]
-
-    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-        with Manager() as manager:
-            results_queue = manager.list()
-            futures = {executor.submit(process_job, job, results_queue): job for job in jobs}
-            for future in as_completed(futures):
-                future.result()
-
-            # After completed
-            print(f'\nCompleted in {round(time.time() - start_time, 3)} seconds')
-            print(f'# successes: {len([x for x in results_queue if x["Ok"]])}')
-            print(f'# failures: {len([x for x in results_queue if not x["Ok"]])}')
-
-            # Save credits data
-            columns = ['id', 'category', 'name', 'profile_path']
-            data_dict = {c: [] for c in columns}
-            for res in tqdm(results_queue, desc='Saving credits data'):
-                if res['Ok']:
-                    credits = res['Credits']
-                    for category in ('Directors', 'Actors'):
-                        for person in credits[category]:
-                            data_dict['id'].append(person['id'])
-                            data_dict['category'].append(category)
-                            data_dict['name'].append(person['name'])
-                            data_dict['profile_path'].append(person['profile_path'])
-            pd.DataFrame(data_dict).drop_duplicates().to_csv(os.path.join('generated', 'credits.csv'), index=False)
-            print('Successfully created credits.csv!')
-
-            # Save details data
-            movies.loc[:, 'Runtime'] = movies['Runtime'].fillna(0)
-            movies = movies.astype({
-                'Genres': 'str', 
-                'Languages': 'str', 
-                'Popularity': 'float',
-                'Poster URI': 'str',
-                'Countries': 'str',
-                'Runtime': 'int',
-                'Average Rating': 'float',
-                'Directors': 'str',
-                'Actors': 'str',
-            })
-            for res in tqdm(results_queue, desc='Saving movie details data'):
-                if res['Ok']:
-                    details = res['Details']
-                    selection = (movies['Name'] == res['Name']) & (movies['Year'] == res['Year'])
-                    movies.loc[selection, 'Genres'] = '.'.join(details['Genres'])
-                    movies.loc[selection, 'Languages'] = '.'.join(details['Languages'])
-                    movies.loc[selection, 'Popularity'] = details['Popularity']
-                    movies.loc[selection, 'Poster URI'] = details['Poster Path']
-                    movies.loc[selection, 'Countries'] = '.'.join(details['Countries'])
-                    movies.loc[selection, 'Runtime'] = details['Runtime']
-                    movies.loc[selection, 'Average Rating'] = details['Vote Average']
-                    credits = res['Credits']
-                    movies.loc[selection, 'Directors'] = '.'.join([str(x['id']) for x in credits['Directors']])
-                    movies.loc[selection, 'Actors'] = '.'.join([str(x['id']) for x in credits['Actors']])
-
-            movies.to_csv(os.path.join('generated', 'movies.csv'), index=False)
-            print('Successfully updated movies.csv!')
+    assert ENGINE in ENGINES, f'`ENGINE` must be one of {ENGINES}!'
+
+    metrics = get_metrics()
+
+    if ENGINE == 'async':
+        metrics.num_workers = NUM_WORKERS
+
+        async def process_job_async(job: dict, fetch) -> dict:
+            metrics.job_started()
+            try:
+                return await _process_job_async(job, fetch, APPEND_CREDITS)
+            finally:
+                metrics.job_finished()
+
+        def send(url: str, acquire) -> dict | None:
+            with metrics.busy():
+                return _send_http_request(url, TIMEOUT=0, ACQUIRE=acquire)
+
+        fetch_async(jobs, process_job_async, send, on_result, cache, REQUESTS_PER_SECOND, NUM_WORKERS=NUM_WORKERS, waiting=metrics.waiting)
+        return
+
+    metrics.num_workers = NUM_THREADS
+
+    def process_job(job: dict) -> dict:
+        with metrics.busy():
+            details, credits = _get_movie_data(job['Name'], job['Year'], cache, APPEND_CREDITS, job.get('TMDB ID'))
+        return ResultObj(job, details, credits)
+
+    def finish(future):
+        metrics.job_finished()
+        on_result(future.result())
+        progress.update()
+
+    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor, tqdm(total=len(jobs), desc='Fetching movie data') as progress:
+        futures = set()
+        for job in jobs:
+            if len(futures) >= NUM_THREADS * MAX_PENDING_PER_THREAD:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+            metrics.job_started()
+            futures.add(executor.submit(process_job, job))
+        for future in wait(futures).done:
+            finish(future)
+
+
+async def _process_job_async(job: dict, fetch, APPEND_CREDITS: bool = True) -> dict:
+    '''
+    Fetch search, details and credits of a movie one after another with
+    `fetch`, getting details and credits in one request if `APPEND_CREDITS`.
+    The search is skipped if the job has a locally resolved `TMDB ID` of a
+    film released in the right year.
+    '''
+
+    name, year = job['Name'], job['Year']
+    details, credits = None, None
+    if job.get('TMDB ID') is not None:
+        details, credits = await _fetch_movie_async(job['TMDB ID'], fetch, APPEND_CREDITS)
+    if details is None or not _released_in(details, year):
+        with get_metrics().stage('search'):
+            tmdb_id = _parse_search(await fetch(search_url(name, year)))
+        details, credits = await _fetch_movie_async(tmdb_id, fetch, APPEND_CREDITS) if tmdb_id is not None else (None, None)
+    return ResultObj(job, details, credits)
+
+
+async def _fetch_movie_async(tmdb_id: int, fetch, APPEND_CREDITS: bool = True) -> tuple:
+    metrics = get_metrics()
+    details, credits = None, None
+    if APPEND_CREDITS:
+        with metrics.stage('details'):
+            movie = await fetch(movie_credits_url(tmdb_id))
+        if movie is not None:
+            details, credits = _parse_movie_details(movie), _parse_movie_credits(movie['credits'])
+    else:
+        with metrics.stage('details'):
+            movie = await fetch(movie_url(tmdb_id))
+        details = _parse_movie_details(movie) if movie is not None else None
+        if details is not None:
+            with metrics.stage('credits'):
+                res = await fetch(credits_url(tmdb_id))
+            credits = _parse_movie_credits(res) if res is not None else None
+    return details, credits
+
+
+def compare_engines(LIMIT: int = 100, NUM_THREADS: int = 10, REQUESTS_PER_SECOND: float = 40, DIR: str = 'generated'):
+    '''
+    Fetch the first `LIMIT` films of the movies table in `DIR` with each
+    engine, with and without appending credits to the details request,
+    bypassing the response cache, and print their throughput. The `async`
+    engine sends at most `REQUESTS_PER_SECOND` requests per second.
+    '''
+
+    movies = read_movies(DIR)
+    jobs = _plan_jobs(movies)[:LIMIT]
+
+    for engine in ENGINES:
+        for append_credits in (True, False):
+            open_session(POOL_SIZE=64)
+            start_time = time.time()
+            results = []
+            _fetch_jobs(jobs, results.append, engine, NUM_THREADS, APPEND_CREDITS=append_credits, REQUESTS_PER_SECOND=REQUESTS_PER_SECOND)
+            elapsed = time.time() - start_time
+            mode = 'appended credits' if append_credits else 'separate credits'
+            print(f'{engine}, {mode}: {len(jobs)} films in {round(elapsed, 3)} seconds ({round(len(jobs) / elapsed, 2)} films/sec, {connection_stats()["Requests"]} requests, {len([x for x in results if x["Ok"]])} successes)')
+
+
+def ResultObj(job: dict, details: dict | None, credits: dict | None) -> dict:
+    '''Represents the tmdb data fetched for a job.'''
+    ok = details is not None and credits is not None
+    return {'Ok': ok, 'Movie URI': job['Movie URI'], 'Name': job['Name'], 'Year': job['Year'], 'Details': details, 'Credits': credits}
             
 
-def _send_http_request(url: str, TIMEOUT: float = 0.1) -> dict | None:
+def _send_http_request(
+        url: str,
+        TIMEOUT: float = 0.1,
+        MAX_RETRIES: int = 5,
+        BACKOFF: float = 0.5,
+        MAX_BACKOFF: float = 30,
+        MAX_RETRY_AFTER: float = 60,
+        REQUEST_TIMEOUT: float = 10,
+        ACQUIRE = None,
+        ) -> dict | None:
     '''
-    Send http request and resolve to answer with optional TIMEOUT.
+    Send http request over the shared session and resolve to answer with
+    optional TIMEOUT. Throttled (429) and server error responses as well as
+    connection errors are retried up to `MAX_RETRIES` times, waiting as long as
+    `Retry-After` asks or else a jittered, exponentially growing delay. A
+    request asked to wait more than `MAX_RETRY_AFTER` seconds is given up, so
+    its film counts as failed instead of holding up a worker. Every
+    attempt waits for the adaptive concurrency limit of the session, and every
+    retry also calls `ACQUIRE()`, if given, to wait for a rate limit shared
+    with other requests.
     '''
 
-    headers = {
-        'accept': 'application/json',
-        'Authorization': f'Bearer {os.environ["TMDB_API_ACCESS_TOKEN"]}'
-    }
+    limiter = get_limiter()
+    metrics = get_metrics()
+    if TIMEOUT > 0:
+        with metrics.waiting('sleep'):
+            time.sleep(TIMEOUT)
+
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt > 0 and ACQUIRE is not None:
+            with metrics.waiting('bucket'):
+                ACQUIRE()
+        with metrics.waiting('limiter'):
+            limiter.acquire()
+        start_time = time.monotonic()
+        try:
+            response = get_session().get(url, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException:
+            response = None
+        latency = time.monotonic() - start_time
+        congested = response is None or response.status_code in RETRY_STATUSES
+        limiter.release(latency, CONGESTED=congested)
+        if response is not None:
+            metrics.record_request(endpoint_type(url), latency, response.status_code, int(response.headers.get('Content-Length', len(response.content))), RETRIED=attempt > 0)
+        else:
+            metrics.record_request(endpoint_type(url), latency, None, 0, RETRIED=attempt > 0)
+
+        if not congested:
+            return response.json() if response.ok else None
+        if attempt < MAX_RETRIES:
+            delay = _retry_delay(response, attempt, BACKOFF, MAX_BACKOFF)
+            if delay > MAX_RETRY_AFTER:
+                return None
+            with metrics.waiting('backoff'):
+                time.sleep(delay)
+
+    return None
+
+
+def _retry_delay(response: requests.Response | None, attempt: int, BACKOFF: float, MAX_BACKOFF: float) -> float:
+    '''
+    Seconds to wait before retrying a request, honoring `Retry-After` given
+    either in seconds or as a date.
+    '''
+
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
 
-    try:
-        time.sleep(TIMEOUT)
-        response = requests.get(url, headers=headers)
-        return response.json() if response.ok else None
-    except requests.HTTPError:
-        return None
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
 
 
-def _get_movie_details(name: str, year: int) -> dict | None:
+def _cached_request(url: str, cache: ResponseCache | None = None) -> dict | None:
+    '''
+    Resolve `url` from `cache` if possible, otherwise send http request and
+    save the answer to `cache`.
+    '''
+
+    if cache is not None:
+        data = cache.get(url)
+        if data is not None:
+            return data
+
+    data = _send_http_request(url)
+    if cache is not None and data is not None:
+        cache.put(url, data)
+    return data
+
+
+def _get_movie_data(
+        name: str,
+        year: int,
+        cache: ResponseCache | None = None,
+        APPEND_CREDITS: bool = True,
+        tmdb_id: int | None = None,
+        ) -> tuple:
+    '''
+    Get the details and credits of a movie, or None for either that could not
+    be fetched. If `APPEND_CREDITS`, both come from a single details request
+    instead of separate details and credits requests. A locally resolved
+    `tmdb_id` is used instead of searching, unless its film was released in
+    another year.
+    '''
+
+    if tmdb_id is not None:
+        details, credits = _get_movie_by_id(tmdb_id, cache, APPEND_CREDITS)
+        if details is not None and _released_in(details, year):
+            return details, credits
+
+    with get_metrics().stage('search'):
+        tmdb_id = _parse_search(_cached_request(search_url(name, year), cache))
+    if tmdb_id is None:
+        return None, None
+    return _get_movie_by_id(tmdb_id, cache, APPEND_CREDITS)
+
+
+def _get_movie_by_id(tmdb_id: int, cache: ResponseCache | None = None, APPEND_CREDITS: bool = True) -> tuple:
+    metrics = get_metrics()
+    if APPEND_CREDITS:
+        with metrics.stage('details'):
+            movie = _cached_request(movie_credits_url(tmdb_id), cache)
+        if movie is None:
+            return None, None
+        return _parse_movie_details(movie), _parse_movie_credits(movie['credits'])
+
+    with metrics.stage('details'):
+        details = _get_movie_details(tmdb_id, cache)
+    if details is None:
+        return None, None
+    with metrics.stage('credits'):
+        credits = _get_movie_credits(tmdb_id, cache=cache)
+    return details, credits
+
+
+def _get_movie_details(tmdb_id: int, cache: ResponseCache | None = None) -> dict | None:
     '''
     Get the following information for a movie: genres, languages,
     popularity, poster_path, countries, runtime, and vote_average.
     '''
 
-    res1 = _send_http_request(search_url(name, year))
-    if res1 is not None and len(res1['results']) > 0:
-        tmdb_id = res1['results'].pop(0)['id']
-        movie = _send_http_request(movie_url(tmdb_id))
-        if movie is not None:
-            genres = [x['name'] for x in movie['genres']]
-            languages = [x['english_name'] for x in movie['spoken_languages']]
-            popularity = movie['popularity']
-            poster_path = movie['poster_path']
-            countries = [x['name'] for x in movie['production_countries']]
-            runtime = movie['runtime']
-            vote_average_10 = movie['vote_average']
-
-            return {
-                'tmdb_id': movie['id'],
-                'Genres': genres,
-                'Languages': languages,
-                'Popularity': popularity,
-                'Poster Path': poster_path,
-                'Countries': countries,
-                'Runtime': runtime,
-                'Vote Average': vote_average_10
-            }
+    movie = _cached_request(movie_url(tmdb_id), cache)
+    if movie is not None:
+        return _parse_movie_details(movie)
     
     return None
 
 
-def _get_movie_credits(tmdb_id: int, MAX_NUM_CAST: int = 10) -> dict | None:
+def _get_movie_credits(tmdb_id: int, MAX_NUM_CAST: int = 10, cache: ResponseCache | None = None) -> dict | None:
     '''
     Get the following information for a movie: directors and `MAX_NUM_CAST` actors.
     '''
 
-    res = _send_http_request(credits_url(tmdb_id))
+    res = _cached_request(credits_url(tmdb_id), cache)
     if res is not None:
-    
-        directors = list(filter(lambda x: x['job'] == 'Director', res['crew']))
-        directors = [{'name': x['name'], 'id': x['id'], 'profile_path': x['profile_path']} for x in directors]
+        return _parse_movie_credits(res, MAX_NUM_CAST)
+
+    return None
 
-        actors = res['cast'][:min(len(res['cast']), MAX_NUM_CAST)]
-        actors = [{'name': x['name'], 'id': x['id'], 'profile_path': x['profile_path']} for x in actors]
 
-        return {
-            'Directors': directors,
-            'Actors': actors
-        }
+def _parse_search(res: dict | None) -> int | None:
+    '''
+    Get the tmdb id of the first search result.
+    '''
 
+    if res is not None and len(res['results']) > 0:
+        return res['results'][0]['id']
     return None
 
 
+def _parse_movie_details(movie: dict) -> dict:
+    '''
+    Pick the details used by the movies table from a tmdb movie response.
+    '''
+
+    genres = [x['name'] for x in movie['genres']]
+    languages = [x['english_name'] for x in movie['spoken_languages']]
+    popularity = movie['popularity']
+    poster_path = movie['poster_path']
+    countries = [x['name'] for x in movie['production_countries']]
+    runtime = movie['runtime']
+    vote_average_10 = movie['vote_average']
+
+    return {
+        'tmdb_id': movie['id'],
+        'Genres': genres,
+        'Languages': languages,
+        'Popularity': popularity,
+        'Poster Path': poster_path,
+        'Countries': countries,
+        'Runtime': runtime,
+        'Vote Average': vote_average_10,
+        'Release Year': int(movie['release_date'][:4]) if movie.get('release_date') else None,
+    }
+
+
+def _released_in(details: dict, year: int, TOLERANCE: int = 1) -> bool:
+    '''
+    Whether the film of `details` was released within `TOLERANCE` years of
+    `year`, or has no known release date.
+    '''
+
+    if details['Release Year'] is None or pd.isna(year):
+        return True
+    return abs(details['Release Year'] - int(year)) <= TOLERANCE
+
+
+def _parse_movie_credits(res: dict, MAX_NUM_CAST: int = 10) -> dict:
+    '''
+    Pick the directors and `MAX_NUM_CAST` actors from a tmdb credits response.
+    '''
+
+    directors = list(filter(lambda x: x['job'] == 'Director', res['crew']))
+    directors = [{'name': x['name'], 'id': x['id'], 'profile_path': x['profile_path']} for x in directors]
+
+    actors = res['cast'][:min(len(res['cast']), MAX_NUM_CAST)]
+    actors = [{'name': x['name'], 'id': x['id'], 'profile_path': x['profile_path']} for x in actors]
+
+    return {
+        'Directors': directors,
+        'Actors': actors
+    }
+
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
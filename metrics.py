@@ -0,0 +1,231 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+
+
+# Upper bounds, in milliseconds, of the request latency histogram buckets
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_metrics = None
+_lock = threading.Lock()
+
+# Wait counters of the `stage` and `busy` blocks enclosing the current code
+_waited = contextvars.ContextVar('waited', default=())
+
+
+class RunMetrics:
+    '''
+    Thread-safe collector of what happened during one fetch run: requests per
+    endpoint (latency, status, retries, bytes), time spent per pipeline stage,
+    time workers spent busy, time spent waiting for rate limits and retries,
+    and periodic samples of the queue.
+
+    Waits are left out of the time of the stages and busy blocks they happen
+    in. These are tracked in a context variable, so waits are attributed to
+    the right block across threads that run in a copy of its context.
+    '''
+
+    def __init__(self, NUM_WORKERS: int = 1):
+        self.num_workers = NUM_WORKERS
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._stages = {}
+        self._waits = {}
+        self._busy_seconds = 0.0
+        self._pending_jobs = 0
+        self._samples = []
+        self._sampler = None
+        self._stop = threading.Event()
+
+    def record_request(self, endpoint: str, latency: float, status: int | None, size: int, RETRIED: bool = False):
+        '''
+        Count one request attempt to `endpoint` that took `latency` seconds and
+        got a response with `status` and `size` bytes (None and 0 if it failed).
+        '''
+
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {'latencies': [], 'statuses': {}, 'retries': 0, 'bytes': 0})
+            stats['latencies'].append(latency)
+            key = str(status) if status is not None else 'error'
+            stats['statuses'][key] = stats['statuses'].get(key, 0) + 1
+            stats['retries'] += int(RETRIED)
+            stats['bytes'] += size
+
+    def latencies(self) -> list:
+        '''
+        Return the latency in seconds of every request attempt so far, over all
+        endpoints.
+        '''
+
+        with self._lock:
+            return [latency for stats in self._endpoints.values() for latency in stats['latencies']]
+
+    @contextmanager
+    def stage(self, name: str):
+        '''
+        Time the enclosed block as part of stage `name`.
+        '''
+
+        start_time = time.monotonic()
+        waited = [0.0]
+        token = _waited.set(_waited.get() + (waited,))
+        try:
+            yield
+        finally:
+            _waited.reset(token)
+            elapsed = time.monotonic() - start_time
+            with self._lock:
+                stats = self._stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'wait_seconds': 0.0})
+                stats['count'] += 1
+                stats['seconds'] += elapsed - waited[0]
+                stats['wait_seconds'] += waited[0]
+
+    @contextmanager
+    def busy(self):
+        '''
+        Count the enclosed block, but for its waits, as time a worker was busy.
+        '''
+
+        start_time = time.monotonic()
+        waited = [0.0]
+        token = _waited.set(_waited.get() + (waited,))
+        try:
+            yield
+        finally:
+            _waited.reset(token)
+            elapsed = time.monotonic() - start_time
+            with self._lock:
+                self._busy_seconds += elapsed - waited[0]
+
+    @contextmanager
+    def waiting(self, kind: str):
+        '''
+        Time the enclosed block as a wait of `kind`, such as for a rate limit
+        or before a retry, rather than as part of the enclosing stages and
+        busy blocks.
+        '''
+
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start_time
+            for waited in _waited.get():
+                waited[0] += elapsed
+            with self._lock:
+                stats = self._waits.setdefault(kind, {'count': 0, 'seconds': 0.0})
+                stats['count'] += 1
+                stats['seconds'] += elapsed
+
+    def job_started(self):
+        with self._lock:
+            self._pending_jobs += 1
+
+    def job_finished(self):
+        with self._lock:
+            self._pending_jobs -= 1
+
+    def start_sampling(self, probe = None, INTERVAL: float = 1.0):
+        '''
+        Sample the number of pending jobs, along with the dict returned by
+        `probe()`, every `INTERVAL` seconds until `stop_sampling()`.
+        '''
+
+        def sample():
+            while not self._stop.wait(INTERVAL):
+                with self._lock:
+                    row = {'t': round(time.monotonic() - self._start, 3), 'pending_jobs': self._pending_jobs}
+                row.update(probe() if probe is not None else {})
+                with self._lock:
+                    self._samples.append(row)
+
+        self._sampler = threading.Thread(target=sample, daemon=True)
+        self._sampler.start()
+
+    def stop_sampling(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def report(self, **extra) -> dict:
+        '''
+        Summarize the run as a JSON-serializable dict, including `extra`.
+        '''
+
+        wall = time.monotonic() - self._start
+        with self._lock:
+            endpoints = {name: _summarize_endpoint(stats) for name, stats in self._endpoints.items()}
+            stages = {name: {'count': s['count'], 'seconds': round(s['seconds'], 3), 'wait_seconds': round(s['wait_seconds'], 3)} for name, s in self._stages.items()}
+            waits = {kind: {'count': w['count'], 'seconds': round(w['seconds'], 3)} for kind, w in self._waits.items()}
+            workers = {
+                'count': self.num_workers,
+                'busy_seconds': round(self._busy_seconds, 3),
+                'utilization': round(self._busy_seconds / (self.num_workers * wall), 4) if wall > 0 else None,
+            }
+            samples = list(self._samples)
+
+        return {
+            'started_at': self.started_at.isoformat(),
+            'wall_seconds': round(wall, 3),
+            **extra,
+            'endpoints': endpoints,
+            'stages': stages,
+            'waits': waits,
+            'workers': workers,
+            'queue': samples,
+        }
+
+    def write_report(self, path: str, **extra):
+        '''
+        Write `report(**extra)` to `path` as JSON.
+        '''
+
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.report(**extra), file, indent=2)
+
+
+def start_run(NUM_WORKERS: int = 1) -> RunMetrics:
+    '''
+    Start collecting metrics for a new run, replacing the previous collector.
+    '''
+
+    global _metrics
+    with _lock:
+        _metrics = RunMetrics(NUM_WORKERS)
+        return _metrics
+
+
+def get_metrics() -> RunMetrics:
+    '''
+    Return the collector of the current run, starting one if needed.
+    '''
+
+    with _lock:
+        metrics = _metrics
+    return metrics if metrics is not None else start_run()
+
+
+def _summarize_endpoint(stats: dict) -> dict:
+    latencies = np.array(stats['latencies']) * 1000
+    counts = np.histogram(latencies, bins=[0, *LATENCY_BUCKETS_MS, np.inf])[0]
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) if len(latencies) else (None, None, None)
+    return {
+        'requests': len(latencies),
+        'retries': stats['retries'],
+        'bytes': stats['bytes'],
+        'statuses': stats['statuses'],
+        'latency_ms': {
+            'mean': round(float(latencies.mean()), 2) if len(latencies) else None,
+            'p50': round(float(p50), 2) if p50 is not None else None,
+            'p90': round(float(p90), 2) if p90 is not None else None,
+            'p99': round(float(p99), 2) if p99 is not None else None,
+            'max': round(float(latencies.max()), 2) if len(latencies) else None,
+            'histogram': {'le': [*LATENCY_BUCKETS_MS, 'inf'], 'counts': counts.tolist()},
+        },
+    }
@@ -0,0 +1,185 @@
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'lognormal')
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family', 'Fantasy', 'History', 'Horror', 'Music', 'Mystery', 'Romance', 'Science Fiction', 'Thriller', 'War', 'Western']
+LANGUAGES = ['English', 'French', 'German', 'Italian', 'Japanese', 'Korean', 'Mandarin', 'Spanish', 'Swedish', 'Hindi']
+COUNTRIES = ['United States of America', 'United Kingdom', 'France', 'Germany', 'Italy', 'Japan', 'South Korea', 'China', 'Spain', 'Sweden', 'India', 'Canada']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve synthetic tmdb search, movie and credits responses for benchmarks.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='median response latency in seconds')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--jitter', type=float, default=0.5, help='spread of the latency: sigma of the lognormal, or relative half-width of the uniform distribution')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with 500')
+    parser.add_argument('--max-rps', type=float, default=None, help='answer requests above this many per second with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='seconds sent in the Retry-After header of 429 responses')
+    args = parser.parse_args()
+
+    server = make_server(
+        PORT=args.port,
+        LATENCY=args.latency,
+        LATENCY_DISTRIBUTION=args.latency_distribution,
+        JITTER=args.jitter,
+        THROTTLE_RATE=args.throttle_rate,
+        FAILURE_RATE=args.failure_rate,
+        MAX_RPS=args.max_rps,
+        RETRY_AFTER=args.retry_after,
+    )
+    print(f'Serving a mock tmdb api at http://127.0.0.1:{server.server_port}/3')
+    server.serve_forever()
+
+
+def make_server(
+        PORT: int = 8765,
+        LATENCY: float = 0.05,
+        LATENCY_DISTRIBUTION: str = 'lognormal',
+        JITTER: float = 0.5,
+        THROTTLE_RATE: float = 0.0,
+        FAILURE_RATE: float = 0.0,
+        MAX_RPS: float = None,
+        RETRY_AFTER: float = 1.0,
+        ) -> ThreadingHTTPServer:
+    '''
+    Make a server answering the tmdb endpoints used by `main.py` under `/3`
+    with synthetic payloads that only depend on the query or id. Every
+    response is delayed by a latency drawn from `LATENCY_DISTRIBUTION` with
+    median `LATENCY`; a random `THROTTLE_RATE` of requests, and any above
+    `MAX_RPS` per second, are answered with 429 and a `Retry-After` of
+    `RETRY_AFTER` seconds, and a random `FAILURE_RATE` with 500.
+    '''
+
+    assert LATENCY_DISTRIBUTION in LATENCY_DISTRIBUTIONS, f'`LATENCY_DISTRIBUTION` must be one of {LATENCY_DISTRIBUTIONS}!'
+
+    window = {'start': time.monotonic(), 'count': 0}
+    lock = threading.Lock()
+
+    def latency() -> float:
+        if LATENCY_DISTRIBUTION == 'uniform':
+            return random.uniform(LATENCY * (1 - JITTER), LATENCY * (1 + JITTER))
+        if LATENCY_DISTRIBUTION == 'lognormal':
+            return random.lognormvariate(0, JITTER) * LATENCY
+        return LATENCY
+
+    def over_limit() -> bool:
+        if MAX_RPS is None:
+            return False
+        with lock:
+            now = time.monotonic()
+            if now - window['start'] >= 1:
+                window['start'], window['count'] = now, 0
+            window['count'] += 1
+            return window['count'] > MAX_RPS
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately, so without this Nagle's
+        # algorithm and delayed acks stall every keep-alive response by ~40 ms
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(max(0.0, latency()))
+
+            if over_limit() or random.random() < THROTTLE_RATE:
+                self._send(429, {'status_code': 25, 'status_message': 'Your request count is over the allowed limit.'}, {'Retry-After': str(RETRY_AFTER)})
+            elif random.random() < FAILURE_RATE:
+                self._send(500, {'status_code': 11, 'status_message': 'Internal error.'})
+            else:
+                data = _respond(self.path)
+                if data is None:
+                    self._send(404, {'status_code': 34, 'status_message': 'The resource you requested could not be found.'})
+                else:
+                    self._send(200, data)
+
+        def _send(self, status: int, data: dict, headers: dict = None):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json;charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', PORT), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def _respond(path: str) -> dict | None:
+    '''
+    Make the synthetic payload for a request `path`.
+    '''
+
+    url = urlparse(path)
+    query = parse_qs(url.query)
+    parts = url.path.strip('/').split('/')
+
+    if parts[:3] == ['3', 'search', 'movie']:
+        title = query.get('query', [''])[0]
+        year = query.get('year', [''])[0]
+        return _search(title, year)
+    if len(parts) == 3 and parts[:2] == ['3', 'movie'] and parts[2].isdigit():
+        movie = _movie(int(parts[2]))
+        if 'credits' in query.get('append_to_response', [''])[0].split(','):
+            movie['credits'] = _credits(int(parts[2]))
+        return movie
+    if len(parts) == 4 and parts[:2] == ['3', 'movie'] and parts[2].isdigit() and parts[3] == 'credits':
+        return _credits(int(parts[2]))
+    return None
+
+
+def _search(title: str, year: str) -> dict:
+    tmdb_id = zlib.crc32(f'{title}|{year}'.encode('utf-8')) % 10_000_000 + 1
+    release_date = f'{year}-01-01' if year.isdigit() else ''
+    return {
+        'page': 1,
+        'results': [{'id': tmdb_id, 'title': title, 'original_title': title, 'release_date': release_date}],
+        'total_pages': 1,
+        'total_results': 1,
+    }
+
+
+def _movie(tmdb_id: int) -> dict:
+    r = random.Random(tmdb_id)
+    return {
+        'id': tmdb_id,
+        'title': f'Movie {tmdb_id}',
+        'overview': ' '.join(r.choices(['lorem', 'ipsum', 'dolor', 'sit', 'amet'], k=60)),
+        'genres': [{'id': i, 'name': g} for i, g in enumerate(r.sample(GENRES, r.randint(1, 3)))],
+        'spoken_languages': [{'english_name': x, 'iso_639_1': x[:2].lower(), 'name': x} for x in r.sample(LANGUAGES, r.randint(1, 2))],
+        'production_countries': [{'iso_3166_1': x[:2].upper(), 'name': x} for x in r.sample(COUNTRIES, r.randint(1, 2))],
+        'popularity': round(r.lognormvariate(2, 1.5), 3),
+        'poster_path': f'/{tmdb_id}.jpg',
+        'release_date': '',
+        'runtime': r.randint(70, 200),
+        'vote_average': round(r.uniform(3, 9), 3),
+        'vote_count': r.randint(0, 20000),
+    }
+
+
+def _credits(tmdb_id: int, CAST_SIZE: int = 40, CREW_SIZE: int = 60) -> dict:
+    r = random.Random(-tmdb_id)
+    person = lambda i: {'id': i, 'name': f'Person {i}', 'profile_path': f'/{i}.jpg' if r.random() < 0.8 else None}
+    num_directors = r.randint(1, 2)
+    cast = [{**person(r.randint(1, 500_000)), 'character': 'Someone', 'order': i} for i in range(CAST_SIZE)]
+    crew = [{**person(r.randint(1, 500_000)), 'department': 'Crew', 'job': 'Director' if i < num_directors else 'Writer'} for i in range(CREW_SIZE)]
+    return {'id': tmdb_id, 'cast': cast, 'crew': crew}
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from engine import AdaptiveConcurrency
+
+
+_session = None
+_limiter = None
+_lock = threading.Lock()
+
+
+def open_session(POOL_SIZE: int = 10, KEEP_ALIVE: bool = True) -> requests.Session:
+    '''
+    Create the session shared by all fetch workers, replacing the previous
+    one. It keeps up to `POOL_SIZE` connections per host open between requests
+    unless `KEEP_ALIVE` is False, and sends the tmdb auth headers with every
+    request. A new concurrency limiter allowing up to `POOL_SIZE` requests in
+    flight is created along with it.
+    '''
+
+    global _session, _limiter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'accept': 'application/json',
+        'Authorization': f'Bearer {os.environ["TMDB_API_ACCESS_TOKEN"]}',
+        'Connection': 'keep-alive' if KEEP_ALIVE else 'close',
+    })
+
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = session
+        _limiter = AdaptiveConcurrency(INITIAL=min(8, POOL_SIZE), MAXIMUM=POOL_SIZE)
+    return session
+
+
+def get_session() -> requests.Session:
+    '''
+    Return the shared session, opening one with default settings if needed.
+    '''
+
+    with _lock:
+        session = _session
+    return session if session is not None else open_session()
+
+
+def get_limiter() -> AdaptiveConcurrency:
+    '''
+    Return the concurrency limiter of the shared session.
+    '''
+
+    get_session()
+    with _lock:
+        return _limiter
+
+
+def connection_stats() -> dict:
+    '''
+    Count the requests sent by the shared session and the connections it had
+    to open for them.
+    '''
+
+    stats = {'Requests': 0, 'Connections': 0}
+    with _lock:
+        session = _session
+    if session is not None:
+        for adapter in {*session.adapters.values()}:
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    stats['Requests'] += pool.num_requests
+                    stats['Connections'] += pool.num_connections
+    stats['Reused'] = stats['Requests'] - stats['Connections']
+    return stats
@@ -1,31 +1,62 @@
 import os
+import argparse
+import hashlib
+import numpy as np
 import pandas as pd
-import yaml
-from functools import reduce
 import requests
 import time
+from concurrent.futures import ProcessPoolExecutor
+from storage import BRIDGE_TABLES, read_movies, read_people, read_bridge_tables, make_bridge_tables, table_exists
+from stats_store import StatsStore, ALL_TIME, STATS_DIR, store_path
+
+
+# Local modules the stats are computed with, so changing any of them recomputes every year
+CODE_MODULES = ('stats.py', 'storage.py', 'stats_store.py')
+
+# Tables shared with the workers computing per-year stats (see `_init_worker`)
+_shared = {}
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Compute all-time and per-year stats from the generated tables.')
+    parser.add_argument('--processes', type=int, default=1, help='number of years computed in parallel')
+    parser.add_argument('--full', action='store_true', help='recompute the stats of every year, even if their data did not change')
+    parser.add_argument('--dir', default='generated', help='folder of the generated tables')
+    parser.add_argument('--stats-dir', default=STATS_DIR, help='folder of the stats store')
+    args = parser.parse_args()
+
+    compute_stats(NUM_PROCESSES=args.processes, INCREMENTAL=not args.full, DIR=args.dir, STATS_DIR=args.stats_dir)
+
+
+def compute_stats(NUM_PROCESSES: int = 1, INCREMENTAL: bool = True, DIR: str = 'generated', STATS_DIR: str = STATS_DIR):
+    '''
+    Compute all-time stats from the tables in `DIR`, then the stats of every
+    year, spread over `NUM_PROCESSES` processes if more than one, and save
+    them to the stats store in `STATS_DIR`. If `INCREMENTAL`, years whose
+    input rows and stats code are unchanged since the last run are skipped.
+    '''
 
     start_time = time.time()
+    store = StatsStore(store_path(STATS_DIR))
 
-    movies = pd.read_csv(os.path.join('generated', 'movies.csv'))
+    movies = read_movies(DIR)
+    bridges = _read_bridge_tables(movies, DIR)
+    diary = _partition_by_year(movies)
+    watches = _count_watches(diary)
+    people = read_people(DIR)
     movies = movies.drop_duplicates(subset=['Movie URI'])
     stats = {}
 
     # Compute `Summary` stats
-    all_directors = reduce(lambda acc, x: {*acc, *set(str(x).split('.'))}, movies['Directors'].tolist(), set())
-    all_countries = reduce(lambda acc, x: {*acc, *set(str(x).split('.'))}, movies['Countries'].tolist(), set())
     stats['Summary'] = {}
     stats['Summary']['Films'] = len(movies)
     stats['Summary']['Hours'] = int(movies['Runtime'].sum() // 60)
-    stats['Summary']['Directors'] = len(all_directors)
-    stats['Summary']['Countries'] = len(all_countries)
+    stats['Summary']['Directors'] = bridges['Directors']['Directors'].nunique()
+    stats['Summary']['Countries'] = bridges['Countries']['Countries'].nunique()
     stats['Summary']['Longest_Streak'] = None
 
     # Compute `By Year` stats
-    h1, h2, h3 = _make_by_year_histograms(movies)
+    h1, h2, h3 = _make_by_year_histograms(movies, diary)
     stats['By_Year'] = {}
     stats['By_Year']['Films'] = h1
     stats['By_Year']['Ratings'] = h2
@@ -36,13 +67,13 @@ def main():
 
     # Compute `Genres, Countries, and Languages` stats
     for category in ('Genres', 'Countries', 'Languages'):
-        hists = _make_gcl_histograms(movies, category)
+        hists = _make_gcl_histograms(movies, category, bridges[category])
         stats[category] = {}
         for metric in ('Most_Watched', 'Highest_Rated'):
             stats[category][metric] = hists[metric]
 
     # Compute `Most Watched` stats
-    stats['Most_Watched'] = _compute_most_watched(movies)
+    stats['Most_Watched'] = _compute_most_watched(movies, watches.groupby(level='Movie URI').sum())
 
     # Compute `Rated Higher Than Average` stats
     highs, lows = _compute_high_and_low(movies)
@@ -52,13 +83,13 @@ def main():
     stats['Rated_Lower_Than_Avg'] = lows
 
     # Compute `Actors` stats
-    hists = _make_credits_histograms(movies, 'Actors')
+    hists = _make_credits_histograms(movies, 'Actors', bridges['Actors'], people)
     stats['Actors'] = {}
     stats['Actors']['Most_Watched'] = hists['Most_Watched']
     stats['Actors']['Highest_Rated'] = hists['Highest_Rated']
 
     # Compute `Directors` stats
-    hists = _make_credits_histograms(movies, 'Directors')
+    hists = _make_credits_histograms(movies, 'Directors', bridges['Directors'], people)
     stats['Directors'] = {}
     stats['Directors']['Most_Watched'] = hists['Most_Watched']
     stats['Directors']['Highest_Rated'] = hists['Highest_Rated']
@@ -66,29 +97,71 @@ def main():
     # Compute `World_Map` stats
     stats['World_Map'] = None
 
-    # Write stats to YAML file
-    os.mkdir('stats')
-    yaml_path = os.path.join('stats', 'all-time-stats.yaml')
-    with open(yaml_path, 'w') as file:
-        yaml.dump(stats, file, default_flow_style=False)
+    store.put(ALL_TIME, stats)
 
     print(f'\nCompleted in {round(time.time() - start_time, 3)} seconds')
-    print('Successfully created all-time-stats.yaml!')
+    print('Successfully saved all-time stats!')
+
+    year_options = sorted(diary['Years'])
+
+    version = _code_version()
+    fingerprints = {year: _fingerprint_year(movies, diary, year, watches, people, version) for year in year_options}
+    previous = store.fingerprints() if INCREMENTAL else {}
+    stale = [year for year in year_options if previous.get(str(year)) != fingerprints[year]]
+    print(f'Computing stats for {len(stale)} of {len(year_options)} years')
+
+    if NUM_PROCESSES > 1:
+        # Tables are sent once to each worker rather than with every year
+        with ProcessPoolExecutor(NUM_PROCESSES, initializer=_init_worker, initargs=(movies, bridges, watches, people, diary)) as executor:
+            for year, year_stats in zip(stale, executor.map(_process_year, stale)):
+                store.put(str(year), year_stats, fingerprints[year])
+    else:
+        for year in stale:
+            store.put(str(year), process_stats_per_year(movies, year, bridges, watches, people, diary), fingerprints[year])
+
+    # Drop the pages of years no longer in the diary
+    for page in store.pages():
+        if page != ALL_TIME and int(page) not in year_options:
+            store.delete(page)
+    store.close()
+
+
+def _init_worker(movies: pd.DataFrame, bridges: dict, watches: pd.Series, people: pd.DataFrame, diary: dict):
+    _shared.update(movies=movies, bridges=bridges, watches=watches, people=people, diary=diary)
 
-    year_options = sorted(movies['Watched Date'].dropna().map(lambda x: int(str(x).split('-')[0])).drop_duplicates().tolist())
-    for year in year_options:
-        process_stats_per_year(movies, year)
 
+def _process_year(year: int) -> dict:
+    return process_stats_per_year(_shared['movies'], year, _shared['bridges'], _shared['watches'], _shared['people'], _shared['diary'])
 
-def process_stats_per_year(movies: pd.DataFrame, year: int):
+
+def process_stats_per_year(
+        movies: pd.DataFrame,
+        year: int,
+        bridges: dict = None,
+        watches: pd.Series = None,
+        people: pd.DataFrame = None,
+        diary: dict = None,
+        ) -> dict:
     '''
-    Compute stats per `year`.
+    Compute stats per `year` from its diary entries, counting every entry in
+    sections about watches and every film once in sections about films.
+    Tables not given are derived from `movies`, which must then be the movies
+    table before dropping duplicate films.
     '''
 
     start_time = time.time()
-    
-    ymovies = movies[movies['Logged'] == True]
-    ymovies = ymovies[ymovies['Watched Date'].str.contains(str(year))]
+
+    if bridges is None:
+        bridges = _read_bridge_tables(movies)
+    if diary is None:
+        diary = _partition_by_year(movies)
+    if watches is None:
+        watches = _count_watches(diary)
+    if people is None:
+        people = read_people()
+
+    ymovies = _select_year(diary, year)
+    yfilms = ymovies.drop_duplicates(subset=['Movie URI'])
 
     year_stats = {}
 
@@ -96,14 +169,14 @@ def process_stats_per_year(movies: pd.DataFrame, year: int):
     year_stats['Year'] = year
     year_stats['Summary'] = {}
     year_stats['Summary']['Diary_Entries'] = len(ymovies)
-    year_stats['Summary']['Reviews'] = len(ymovies[ymovies['Reviewed'] == True])
+    year_stats['Summary']['Reviews'] = len(yfilms[yfilms['Reviewed'] == True])
     year_stats['Summary']['Lists'] = None
     year_stats['Summary']['Likes'] = None
     year_stats['Summary']['Comments'] = None
     year_stats['Summary']['Hours'] = int(ymovies['Runtime'].sum() // 60)
 
     # Compute `Highest Rated Films` stats
-    year_stats['Highest_Rated'] = _compute_highest_rated(ymovies, year)
+    year_stats['Highest_Rated'] = _compute_highest_rated(yfilms, year)
 
     # Compute `By Week` stats
     year_stats['By_Week'] = None
@@ -115,11 +188,11 @@ def process_stats_per_year(movies: pd.DataFrame, year: int):
     year_stats['Milestones']['Last'] =  milestones['Last']
 
     # Compute `Most Watched` stats
-    year_stats['Most_Watched'] = _compute_most_watched(ymovies)
+    year_stats['Most_Watched'] = _compute_most_watched(yfilms, watches.xs(year, level='Watched Year'))
 
     # Compute `Genres, Countries, and Languages` stats
     for category in ('Genres', 'Countries', 'Languages'):
-        hists = _make_gcl_histograms(ymovies, category)
+        hists = _make_gcl_histograms(yfilms, category, bridges[category])
         year_stats[category] = {}
         for metric in ('Most_Watched', 'Highest_Rated'):
             year_stats[category][metric] = hists[metric]
@@ -133,19 +206,19 @@ def process_stats_per_year(movies: pd.DataFrame, year: int):
     year_stats['Breakdown']['Ratings_Spread'] = pc['Ratings_Spread']
     
     # Compute `Actors` stats
-    hists = _make_credits_histograms(ymovies, 'Actors')
+    hists = _make_credits_histograms(yfilms, 'Actors', bridges['Actors'], people)
     year_stats['Actors'] = {}
     year_stats['Actors']['Most_Watched'] = hists['Most_Watched']
     year_stats['Actors']['Highest_Rated'] = hists['Highest_Rated']
 
     # Compute `Directors` stats
-    hists = _make_credits_histograms(ymovies, 'Directors')
+    hists = _make_credits_histograms(yfilms, 'Directors', bridges['Directors'], people)
     year_stats['Directors'] = {}
     year_stats['Directors']['Most_Watched'] = hists['Most_Watched']
     year_stats['Directors']['Highest_Rated'] = hists['Highest_Rated']
 
     # Compute `Highs and Lows` stats
-    hl2 = _compute_high_and_low_2(ymovies)
+    hl2 = _compute_high_and_low_2(yfilms)
     year_stats['High_And_Lows'] = {}
     year_stats['High_And_Lows']['Highest_Average'] = hl2['Highest_Average']
     year_stats['High_And_Lows']['Lowest_Average'] = hl2['Lowest_Average']
@@ -153,19 +226,78 @@ def process_stats_per_year(movies: pd.DataFrame, year: int):
     year_stats['High_And_Lows']['Most_Obscure'] = hl2['Most_Obscure']
 
     # Compute `Rated Higher Than Average` stats
-    highs, lows = _compute_high_and_low(ymovies)
+    highs, lows = _compute_high_and_low(yfilms)
     year_stats['Rated_Higher_Than_Avg'] = highs
 
     # Compute `Rated Lower Than Average` stats
     year_stats['Rated_Lower_Than_Avg'] = lows
 
-    # Write stats to YAML file
-    yaml_path = os.path.join('stats', f'{year}-stats.yaml')
-    with open(yaml_path, 'w') as file:
-        yaml.dump(year_stats, file, default_flow_style=False)
-
     print(f'\nCompleted in {round(time.time() - start_time, 3)} seconds')
-    print(f'Successfully created {year}-stats.yaml!')
+    print(f'Successfully computed {year} stats!')
+
+    return year_stats
+
+
+def _partition_by_year(movies: pd.DataFrame) -> dict:
+    '''
+    Sort the diary entries of `movies`, the table before dropping duplicate
+    films, by their watched date, parsed once, and map each year to the range
+    of its rows, so that selecting a year is a slice. Entries without a valid
+    date are left out. Returns a dict with the sorted `Entries`, their parsed
+    `Dates` and the `(start, stop)` row range of each of its `Years`.
+    '''
+
+    entries = movies[movies['Logged'] == True]
+    dates = pd.to_datetime(entries['Watched Date'], format='%Y-%m-%d', errors='coerce')
+    valid = dates.notna().to_numpy()
+    entries, dates = entries[valid], dates[valid]
+    order = np.argsort(dates.to_numpy(), kind='stable')
+    entries, dates = entries.iloc[order], dates.iloc[order]
+
+    years, starts = np.unique(dates.dt.year.to_numpy(), return_index=True)
+    stops = [*starts[1:], len(entries)]
+    return {'Entries': entries, 'Dates': dates, 'Years': {int(y): (int(start), int(stop)) for y, start, stop in zip(years, starts, stops)}}
+
+
+def _select_year(diary: dict, year: int) -> pd.DataFrame:
+    '''
+    Select the diary entries watched in `year` from a partition made by
+    `_partition_by_year`.
+    '''
+
+    start, stop = diary['Years'].get(year, (0, 0))
+    return diary['Entries'].iloc[start:stop]
+
+
+def _code_version() -> str:
+    '''
+    Fingerprint of the `CODE_MODULES`, including the table schemas and the
+    readers of the tables, so that every year is recomputed after any of them
+    changes.
+    '''
+
+    digest = hashlib.sha256()
+    for name in CODE_MODULES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def _fingerprint_year(movies: pd.DataFrame, diary: dict, year: int, watches: pd.Series, people: pd.DataFrame, version: str) -> str:
+    '''
+    Fingerprint of every row the stats of `year` are computed from: its diary
+    entries, its watch counts and the films they count, and the people
+    credited in its films, along with the `version` of the code.
+    '''
+
+    ymovies = _select_year(diary, year)
+    ywatches = watches.xs(year, level='Watched Year')
+    ids = pd.concat([ymovies['Directors'].explode(), ymovies['Actors'].explode()]).dropna().astype('int64').unique()
+
+    digest = hashlib.sha256(version.encode('utf-8'))
+    for df in (ymovies, ywatches.reset_index(), movies[movies['Movie URI'].isin(ywatches.index)], people.reindex(sorted(ids))):
+        digest.update(df.to_csv().encode('utf-8'))
+    return digest.hexdigest()
 
 
 def _map_values(value, from_min=1, from_max=10, to_min=0.5, to_max=5):
@@ -236,30 +368,42 @@ def _compute_highest_rated_decades(
     return results
 
 
-def _compute_most_watched(movies: pd.DataFrame, TOP_K_FILMS: int = 10) -> list:
+def _count_watches(diary: dict) -> pd.Series:
     '''
-    Computes the `TOP_K_FILMS` rewatched the most by the user.
+    Count the diary entries of every film in each year, as a series indexed by
+    `Watched Year` and `Movie URI`, from a partition made by
+    `_partition_by_year`.
+    '''
+
+    years = diary['Dates'].dt.year.astype('int64').rename('Watched Year')
+    return diary['Entries'].groupby([years, 'Movie URI']).size()
+
+
+def _compute_most_watched(movies: pd.DataFrame, watches: pd.Series, TOP_K_FILMS: int = 10) -> list:
+    '''
+    Computes the `TOP_K_FILMS` rewatched the most by the user, given the
+    number of `watches` of each `Movie URI` (see `_count_watches`) in
+    `movies`.
     '''
 
     results = []
 
-    _movies = movies[movies['Rewatch'] == 'Yes']
-    _movies.insert(len(_movies.columns), 'Times Rewatched', [len(movies[movies['Movie URI'] == x['Movie URI']]) for _,x in _movies.iterrows()])
-    _movies = _movies.sort_values(by='Times Rewatched', ascending=False)
-    _movies = _movies.head(TOP_K_FILMS)
+    top = watches[watches > 1].nlargest(TOP_K_FILMS)
+    films = movies.drop_duplicates(subset=['Movie URI']).set_index('Movie URI')
+    assert top.index.isin(films.index).all(), 'Every watched film must be in `movies`!'
+    films = films.reindex(top.index)
 
-    for _,movie in _movies.iterrows():
-        if movie['Times Rewatched'] > 1:
-            item = MovieObj(movie['Name'], movie['Year'], movie['Movie URI'], movie['Poster URI'])
-            times_rewatched = movie['Times Rewatched']
-            results.append({'Movie': item, 'Times_Rewatched': times_rewatched})
+    for uri, movie in films.iterrows():
+        item = MovieObj(movie['Name'], movie['Year'], uri, movie['Poster URI'])
+        results.append({'Movie': item, 'Times_Rewatched': int(top[uri])})
 
     return results
 
 
-def _make_by_year_histograms(movies: pd.DataFrame, MIN_FILMS_YEAR: int = 3) -> tuple:
+def _make_by_year_histograms(movies: pd.DataFrame, diary: dict, MIN_FILMS_YEAR: int = 3) -> tuple:
     '''
-    Make histograms for `By Year` section.
+    Make histograms for `By Year` section, counting the diary entries of each
+    year from a partition made by `_partition_by_year`.
     '''
 
     start_year = movies.sort_values(by='Year', ascending=True)['Year'].head(1).item()
@@ -281,49 +425,58 @@ def _make_by_year_histograms(movies: pd.DataFrame, MIN_FILMS_YEAR: int = 3) -> t
     h2 = HistogramObj('Year', years.copy(), 'Rating', avg_rating)
 
     # Diary per Year
-    grouped3 = movies[movies['Logged'] == True]
-    grouped3.loc[:, 'Watched Date'] = grouped3['Watched Date'].map(lambda x: int(x.split('-')[0]))
-    grouped3 = grouped3.groupby('Watched Date').size().reset_index(name='Count')
-    grouped3 = grouped3.sort_values(by='Watched Date', ascending=True)
-    start_watched_year = grouped3['Watched Date'].head(1).item()
-    stop_watched_year = grouped3['Watched Date'].tail(1).item()
-    watched_years = list(range(start_watched_year, stop_watched_year+1))
-    watched_counts = [grouped3[grouped3['Watched Date'] == y]['Count'].item() if y in grouped3['Watched Date'].tolist() else 0 for y in watched_years]
+    ranges = diary['Years']
+    watched_years = list(range(min(ranges), max(ranges)+1)) if ranges else []
+    watched_counts = [ranges[y][1] - ranges[y][0] if y in ranges else 0 for y in watched_years]
     h3 = HistogramObj('Year', watched_years, 'Count', watched_counts)
 
     return h1, h2, h3
 
 
+def _read_bridge_tables(movies: pd.DataFrame, DIR: str = 'generated') -> dict:
+    '''
+    Read the bridge tables in `DIR` as a dict from each multi-valued column to
+    a (`Movie URI`, value) table, deriving them from `movies` if they were not
+    generated.
+    '''
+
+    tables = read_bridge_tables(DIR) if table_exists('movie_people', DIR) else make_bridge_tables(movies)
+
+    bridges = {}
+    for column, (name, value) in BRIDGE_TABLES.items():
+        bridges[column] = tables[name].rename(columns={value: column})
+    people = tables['movie_people']
+    for role in ('Directors', 'Actors'):
+        bridges[role] = people[people['role'] == role][['Movie URI', 'id']].rename(columns={'id': role})
+
+    # Join on the codes of the films rather than hashing every URI on each join
+    for column in bridges:
+        bridges[column] = bridges[column].astype({'Movie URI': 'category'}).reset_index(drop=True)
+    return bridges
+
+
 def _make_gcl_histograms(
         movies: pd.DataFrame, 
         column: str, 
+        bridge: pd.DataFrame,
         MIN_FILMS_PER_CATEGORY: int = 3,
         MAX_FILMS_PER_CATEGORY: int = 10
         ) -> tuple:
     '''
-    Make histograms for `Genres, Countries, and Languages` section.
+    Make histograms for `Genres, Countries, and Languages` section from the
+    `bridge` table relating films to the values of `column` (see
+    `_read_bridge_tables`), counting and averaging the ratings of every value
+    in a single group-by.
     '''
 
     result = {}
 
-    vals = movies[column].dropna().tolist()
-    all_vals = reduce(lambda acc, x: [*acc, *set(str(x).split('.'))], vals, [])
-    data_dict = {column: [], 'Count': [], 'Average Rating': []}
-    for val in all_vals:
-        data_dict[column].append(val)
-        data_dict['Count'].append(1)
-
-        _movies = movies.dropna(subset=[column])
-        _movies = _movies[_movies['Rated'] == True]
-        _movies = _movies[_movies[column].str.contains(val)]['Rating']
-        if len(_movies) >= MIN_FILMS_PER_CATEGORY:
-            avg_rating = round(_movies.mean(), 2)
-        else:
-            avg_rating = 0
-        data_dict['Average Rating'].append(avg_rating)
-
-    grouped = pd.DataFrame(data_dict)
-    grouped = grouped.groupby(column).agg(total=('Count', 'sum'), average_rating=('Average Rating', 'first')).reset_index()
+    films = bridge['Movie URI'].cat.categories
+    _movies = pd.DataFrame({'Film': films.get_indexer(movies['Movie URI']), 'Rated': movies['Rated'].to_numpy() == True, 'Rating': movies['Rating'].to_numpy()})
+    _movies = _movies.merge(pd.DataFrame({'Film': bridge['Movie URI'].cat.codes, column: bridge[column]}), on='Film')
+    _movies['Rating'] = _movies['Rating'].where(_movies['Rated'])
+    grouped = _movies.groupby(column).agg(total=('Film', 'size'), rated=('Rated', 'sum'), average_rating=('Rating', 'mean')).reset_index()
+    grouped['average_rating'] = grouped['average_rating'].round(2).where(grouped['rated'] >= MIN_FILMS_PER_CATEGORY, 0)
     
     grouped_total = grouped.sort_values(by='total', ascending=False).head(MAX_FILMS_PER_CATEGORY)
     result['Most_Watched'] = HistogramObj(column, grouped_total[column].tolist(), 'Count', grouped_total['total'].tolist())
@@ -367,21 +520,18 @@ def _compute_high_and_low(movies: pd.DataFrame, MIN_NUM_FILMS: int = 3, MAX_NUM_
     return highs, lows
 
 
-def _make_credits_histograms(movies: pd.DataFrame, column: str):
+def _make_credits_histograms(movies: pd.DataFrame, column: str, bridge: pd.DataFrame, people: pd.DataFrame):
     '''
-    Make histograms for `Actors` and `Directors` sections.
+    Make histograms for `Actors` and `Directors` sections, looking up the name
+    and picture of each person in `people` (see `read_people`).
     '''
 
-    credits_df = pd.read_csv(os.path.join('generated', 'credits.csv'))
-    credits_df = credits_df[credits_df['category'] == column]
-
-    hists = _make_gcl_histograms(movies, column)
+    hists = _make_gcl_histograms(movies, column, bridge)
 
     for category in ('Most_Watched', 'Highest_Rated'):
-        ids = hists[category][column]
-        names = [credits_df[credits_df['id'] == int(i)]['name'].item() for i in ids]
-        profiles = [credits_df[credits_df['id'] == int(i)]['profile_path'].item() for i in ids]
-        hists[category][column] = [{'Name': names[i], 'Profile URI': profiles[i]} for i in range(len(ids))]
+        found = people.reindex([int(i) for i in hists[category][column]])
+        found = found.astype(object).where(found.notna(), None)
+        hists[category][column] = [{'Name': name, 'Profile URI': profile} for name, profile in zip(found['name'], found['profile_path'])]
     
     return hists
 
@@ -428,14 +578,16 @@ def _compute_milestones(movies: pd.DataFrame) -> dict:
 
 def _compute_breakdown(movies: pd.DataFrame, year: int) -> dict:
     '''
-    Compute pie chart data.
+    Compute pie chart data from the diary entries in `movies`, counting
+    watches per entry and everything else per film.
     '''
 
     result = {}
+    films = movies.drop_duplicates(subset=['Movie URI'])
     
     # Current year releases vs older
-    grouped1_y = movies[movies['Year'] == year]
-    grouped1_ny = movies[movies['Year'] != year]
+    grouped1_y = films[films['Year'] == year]
+    grouped1_ny = films[films['Year'] != year]
     result['Current_Year_Releases'] = {}
     result['Current_Year_Releases'][f'{year}_Releases'] = len(grouped1_y)
     result['Current_Year_Releases']['Older'] = len(grouped1_ny)
@@ -450,15 +602,15 @@ def _compute_breakdown(movies: pd.DataFrame, year: int) -> dict:
     result['Watches']['Total'] = len(grouped2_w) + len(grouped2_r)
 
     # Reviewed vs not reviewed
-    grouped3_r = movies[movies['Reviewed'] == True]
-    grouped3_nr = movies[movies['Reviewed'] == False]
+    grouped3_r = films[films['Reviewed'] == True]
+    grouped3_nr = films[films['Reviewed'] == False]
     result['Reviewed'] = {}
     result['Reviewed']['Reviewed'] = len(grouped3_r)
     result['Reviewed']['Not_Reviewed'] = len(grouped3_nr)
     result['Reviewed']['Total'] = len(grouped3_r) + len(grouped3_nr)
 
     # Ratings spread histogram
-    grouped4 = movies.groupby('Rating').size().reset_index(name='Count')
+    grouped4 = films.groupby('Rating').size().reset_index(name='Count')
     grouped4 = grouped4.sort_values(by='Rating', ascending=True)
     bins =  [i/10 for i in range(5, 55, 5)]
     counts = [grouped4[grouped4['Rating'] == i]['Count'].item() if i in grouped4['Rating'].tolist() else 0 for i in bins]
@@ -0,0 +1,114 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+
+STATS_DIR = 'stats'
+
+# Bump when the layout of the store or of its pages changes, to drop old pages
+STORE_VERSION = 1
+
+ALL_TIME = 'all-time'
+
+
+def store_path(DIR: str = STATS_DIR) -> str:
+    '''
+    Path of the stats store kept in `DIR`.
+    '''
+
+    return os.path.join(DIR, 'stats.sqlite')
+
+
+class StatsStore:
+    '''
+    Store of the stats pages shown by `ui.py`, backed by SQLite: one JSON
+    payload per page, `ALL_TIME` or a year, which can be read on its own.
+
+    Each page is saved with a fingerprint of the data and code it was
+    computed from, so unchanged pages need not be computed again. Pages saved
+    by another `STORE_VERSION` are dropped when the store is opened.
+
+    If `READ_ONLY`, as for the user interface, the store is never created or
+    changed, and opening it raises `sqlite3.Error` if it is missing or was
+    saved by another `STORE_VERSION`.
+    '''
+
+    def __init__(self, path: str = store_path(), READ_ONLY: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        if READ_ONLY:
+            self._conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or int(row[0]) != STORE_VERSION:
+                self._conn.close()
+                raise sqlite3.DatabaseError(f'{path} was saved by another version of stats.py')
+            return
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                page TEXT PRIMARY KEY,
+                fingerprint TEXT,
+                updated_at REAL NOT NULL,
+                payload TEXT NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or int(row[0]) != STORE_VERSION:
+            self._conn.execute('DELETE FROM pages')
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(STORE_VERSION),))
+        self._conn.commit()
+
+    def get(self, page: str) -> dict | None:
+        '''
+        Return the payload of `page`, or None if it was never saved.
+        '''
+
+        with self._lock:
+            row = self._conn.execute('SELECT payload FROM pages WHERE page = ?', (page,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, page: str, payload: dict, fingerprint: str = None):
+        '''
+        Save the `payload` of `page`, computed from data and code with
+        `fingerprint`.
+        '''
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages (page, fingerprint, updated_at, payload) VALUES (?, ?, ?, ?)',
+                (page, fingerprint, time.time(), json.dumps(payload, separators=(',', ':')))
+            )
+            self._conn.commit()
+
+    def delete(self, page: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM pages WHERE page = ?', (page,))
+            self._conn.commit()
+
+    def pages(self) -> list:
+        '''
+        Return the name of every saved page.
+        '''
+
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT page FROM pages ORDER BY page')]
+
+    def fingerprints(self) -> dict:
+        '''
+        Return the fingerprint of every saved page.
+        '''
+
+        with self._lock:
+            return dict(self._conn.execute('SELECT page, fingerprint FROM pages').fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,262 @@
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+FORMATS = ('csv', 'parquet')
+
+# Columns holding several values, stored as '.'-joined strings in csv files
+MULTI_VALUED = ['Countries', 'Genres', 'Languages', 'Directors', 'Actors']
+PEOPLE = ['Directors', 'Actors']
+
+_category = pa.dictionary(pa.int32(), pa.string())
+
+MOVIES_SCHEMA = pa.schema([
+    ('Rated', pa.bool_()),
+    ('Logged', pa.bool_()),
+    ('Reviewed', pa.bool_()),
+    ('Date', pa.string()),
+    ('Name', pa.string()),
+    ('Year', pa.int32()),
+    ('Movie URI', pa.string()),
+    ('Runtime', pa.int32()),
+    ('Countries', pa.list_(_category)),
+    ('Genres', pa.list_(_category)),
+    ('Languages', pa.list_(_category)),
+    ('Average Rating', pa.float64()),
+    ('Popularity', pa.float64()),
+    ('Poster URI', pa.string()),
+    ('Directors', pa.list_(pa.int64())),
+    ('Actors', pa.list_(pa.int64())),
+    ('TMDB ID', pa.int64()),
+    ('Rating', pa.float64()),
+    ('Rewatch', _category),
+    ('Tags', pa.string()),
+    ('Watched Date', pa.string()),
+    ('Diary URI', pa.string()),
+])
+
+CREDITS_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('category', _category),
+    ('name', pa.string()),
+    ('profile_path', pa.string()),
+])
+
+# Long-form tables relating each film to the values of a multi-valued column
+BRIDGE_TABLES = {
+    'Genres': ('movie_genres', 'Genre'),
+    'Countries': ('movie_countries', 'Country'),
+    'Languages': ('movie_languages', 'Language'),
+}
+
+PEOPLE_SCHEMA = pa.schema([
+    ('Movie URI', pa.string()),
+    ('id', pa.int64()),
+    ('role', _category),
+    ('order', pa.int32()),
+])
+
+# One row per person of the credits table, to look up names and pictures by id
+PERSON_INDEX_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('name', pa.string()),
+    ('profile_path', pa.string()),
+])
+
+SCHEMAS = {
+    'movies': MOVIES_SCHEMA,
+    'credits': CREDITS_SCHEMA,
+    'movie_people': PEOPLE_SCHEMA,
+    'people': PERSON_INDEX_SCHEMA,
+}
+for name, value in BRIDGE_TABLES.values():
+    SCHEMAS[name] = pa.schema([('Movie URI', pa.string()), (value, _category)])
+
+
+def read_movies(DIR: str = 'generated', COLUMNS: list = None) -> pd.DataFrame:
+    '''
+    Read the movies table, optionally only `COLUMNS`, from the most recently
+    written of `movies.parquet` and `movies.csv`. Multi-valued columns hold
+    sequences of values (ids for `Directors` and `Actors`), or None for films
+    without tmdb data.
+    '''
+
+    path = _latest(DIR, 'movies')
+    if path.endswith('.parquet'):
+        return read_table('movies', DIR, COLUMNS)
+
+    # Floats are parsed exactly so that rewriting the table does not change them
+    dtype = {c: 'str' for c in MULTI_VALUED}
+    df = pd.read_csv(path, usecols=COLUMNS, dtype=dtype, float_precision='round_trip')
+    for c in MULTI_VALUED:
+        if c in df.columns:
+            split = df[c].str.split('.')
+            df[c] = split.map(lambda x: [int(i) for i in x], na_action='ignore') if c in PEOPLE else split
+            df[c] = df[c].astype(object).where(df[c].notna(), None)
+    return df
+
+
+def write_movies(df: pd.DataFrame, FORMAT: str = 'csv', DIR: str = 'generated'):
+    '''
+    Write the movies table as `movies.{FORMAT}`.
+    '''
+
+    if FORMAT == 'csv':
+        df = df.copy()
+        for c in MULTI_VALUED:
+            df[c] = df[c].map(lambda x: '.'.join([str(i) for i in x]), na_action='ignore')
+        df = df.astype({'Runtime': 'Int64', 'TMDB ID': 'Int64'})
+    write_table(df, 'movies', FORMAT, DIR)
+
+
+def read_credits(DIR: str = 'generated') -> pd.DataFrame:
+    '''
+    Read the credits table from the most recently written of
+    `credits.parquet` and `credits.csv`.
+    '''
+
+    return read_table('credits', DIR)
+
+
+def write_credits(df: pd.DataFrame, FORMAT: str = 'csv', DIR: str = 'generated'):
+    '''
+    Write the credits table as `credits.{FORMAT}`.
+    '''
+
+    write_table(df, 'credits', FORMAT, DIR)
+
+
+def make_people_table(credits: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Make one row per person in the `credits` table with their `name` and
+    `profile_path`, keeping the last credit of people credited several times.
+    '''
+
+    return credits.drop_duplicates(subset=['id'], keep='last')[['id', 'name', 'profile_path']].reset_index(drop=True)
+
+
+def write_people(credits: pd.DataFrame, DIR: str = 'generated'):
+    '''
+    Write `make_people_table(credits)` as `people.parquet`, whatever the
+    format of the other tables, as it is only read back by `read_people`.
+    '''
+
+    write_table(make_people_table(credits), 'people', 'parquet', DIR)
+
+
+def read_people(DIR: str = 'generated') -> pd.DataFrame:
+    '''
+    Read the people table indexed by `id`, deriving it from the credits table
+    if it was not generated.
+    '''
+
+    people = read_table('people', DIR) if table_exists('people', DIR) else make_people_table(read_credits(DIR))
+    return people.set_index('id')
+
+
+def make_bridge_tables(movies: pd.DataFrame) -> dict:
+    '''
+    Split the multi-valued columns of the movies table into one row per film
+    and value: `movie_genres`, `movie_countries`, `movie_languages`, and
+    `movie_people` with the `role` (`Directors` or `Actors`) and billing
+    `order` of each person.
+    '''
+
+    films = movies.drop_duplicates(subset=['Movie URI'])
+    tables = {}
+
+    for column, (name, value) in BRIDGE_TABLES.items():
+        long = films[['Movie URI', column]].explode(column).dropna()
+        tables[name] = long.rename(columns={column: value}).drop_duplicates().reset_index(drop=True)
+
+    people = []
+    for role in PEOPLE:
+        long = films[['Movie URI', role]].explode(role).dropna().rename(columns={role: 'id'})
+        long['order'] = long.groupby(level=0).cumcount()
+        people.append(long.assign(role=role))
+    people = pd.concat(people, ignore_index=True).astype({'id': 'int64'})
+    tables['movie_people'] = people.drop_duplicates(subset=['Movie URI', 'id', 'role'])[['Movie URI', 'id', 'role', 'order']].reset_index(drop=True)
+
+    return tables
+
+
+def write_bridge_tables(movies: pd.DataFrame, FORMAT: str = 'csv', DIR: str = 'generated'):
+    '''
+    Write the tables of `make_bridge_tables` as `{name}.{FORMAT}`.
+    '''
+
+    for name, df in make_bridge_tables(movies).items():
+        write_table(df, name, FORMAT, DIR)
+
+
+def read_bridge_tables(DIR: str = 'generated') -> dict:
+    '''
+    Read the tables written by `write_bridge_tables`.
+    '''
+
+    names = [name for name, _ in BRIDGE_TABLES.values()] + ['movie_people']
+    return {name: read_table(name, DIR) for name in names}
+
+
+def read_table(name: str, DIR: str = 'generated', COLUMNS: list = None) -> pd.DataFrame:
+    '''
+    Read table `name` from the most recently written of its parquet and csv
+    files. Dictionary encoded strings are decoded to plain ones.
+    '''
+
+    path = _latest(DIR, name)
+    if path.endswith('.parquet'):
+        table = pq.read_table(path, columns=COLUMNS)
+        schema = pa.schema([pa.field(f.name, _plain_type(f.type)) for f in table.schema])
+        return table.cast(schema).to_pandas()
+    return pd.read_csv(path, usecols=COLUMNS, float_precision='round_trip')
+
+
+def write_table(df: pd.DataFrame, name: str, FORMAT: str = 'csv', DIR: str = 'generated'):
+    '''
+    Write table `name` as `{name}.{FORMAT}`, following its schema in `SCHEMAS`
+    for parquet files.
+    '''
+
+    assert FORMAT in FORMATS, f'`FORMAT` must be one of {FORMATS}!'
+
+    if FORMAT == 'parquet':
+        _write_parquet(df, SCHEMAS[name], os.path.join(DIR, f'{name}.parquet'))
+    else:
+        df.to_csv(os.path.join(DIR, f'{name}.csv'), index=False)
+
+
+def table_exists(name: str, DIR: str = 'generated') -> bool:
+    '''
+    Whether table `name` was written in any format.
+    '''
+
+    return any(os.path.exists(os.path.join(DIR, f'{name}.{f}')) for f in FORMATS)
+
+
+def _latest(DIR: str, name: str) -> str:
+    paths = [os.path.join(DIR, f'{name}.{f}') for f in FORMATS]
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths:
+        raise FileNotFoundError(f'No {name} table in {DIR}')
+    return max(paths, key=os.path.getmtime)
+
+
+def _write_parquet(df: pd.DataFrame, schema: pa.Schema, path: str):
+    '''
+    Convert `df` to `schema`, dictionary encoding strings where it asks to.
+    '''
+
+    plain = pa.schema([pa.field(f.name, _plain_type(f.type)) for f in schema])
+    table = pa.Table.from_pandas(df[plain.names], schema=plain, preserve_index=False)
+    pq.write_table(table.cast(schema), path, compression='zstd')
+
+
+def _plain_type(t: pa.DataType) -> pa.DataType:
+    if pa.types.is_dictionary(t):
+        return t.value_type
+    if pa.types.is_list(t):
+        return pa.list_(_plain_type(t.value_type))
+    return t
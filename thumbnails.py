@@ -0,0 +1,148 @@
+import os
+import argparse
+import io
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from tqdm import tqdm
+from stats_store import StatsStore, STATS_DIR, store_path
+
+
+# Served by streamlit at `app/static/thumbnails/...` (see `.streamlit/config.toml`)
+THUMBNAILS_DIR = os.path.join('static', 'thumbnails')
+
+# Widths at which `ui.py` renders posters and profile pictures
+WIDTHS = (70, 100, 150)
+
+# tmdb image size downloaded for each kind of image in the stats pages
+SOURCE_SIZES = {'Poster': 'w342', 'Profile URI': 'h632'}
+
+image_url = lambda size, path: f'https://image.tmdb.org/t/p/{size}{path}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download and resize the images shown by the user interface.')
+    parser.add_argument('--max-mb', type=float, default=200, help='size above which the least recently used thumbnails are deleted')
+    parser.add_argument('--stats-dir', default=STATS_DIR, help='folder of the stats store')
+    args = parser.parse_args()
+
+    prefetch(MAX_BYTES=int(args.max_mb * 1024 * 1024), STATS_DIR=args.stats_dir)
+
+
+def prefetch(
+        WIDTHS: tuple = WIDTHS,
+        SCALE: int = 2,
+        NUM_THREADS: int = 8,
+        MAX_BYTES: int = 200 * 1024 * 1024,
+        STATS_DIR: str = STATS_DIR,
+        ):
+    '''
+    Save a thumbnail of every poster and profile picture referenced in the
+    stats pages in `STATS_DIR` at each of `WIDTHS` (times `SCALE`, for high density
+    screens). Thumbnails already saved are kept and marked as used, then the
+    least recently used ones are deleted until they take up at most
+    `MAX_BYTES`.
+    '''
+
+    images = {}
+    store = StatsStore(store_path(STATS_DIR), READ_ONLY=True)
+    for page in store.pages():
+        _find_images(store.get(page), images)
+    store.close()
+
+    missing = [(path, key) for path, key in images.items() if any(thumbnail_path(path, w) is None for w in WIDTHS)]
+    for path in images:
+        for width in WIDTHS:
+            local = thumbnail_path(path, width)
+            if local is not None:
+                os.utime(local)
+    print(f'Fetching {len(missing)} of {len(images)} images')
+
+    session = requests.Session()
+    def fetch(item: tuple) -> bool:
+        path, key = item
+        try:
+            response = session.get(image_url(SOURCE_SIZES[key], path), timeout=30)
+            response.raise_for_status()
+            _save_thumbnails(response.content, path, WIDTHS, SCALE)
+            return True
+        except (requests.RequestException, OSError):
+            return False
+
+    with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
+        results = list(tqdm(executor.map(fetch, missing), total=len(missing), desc='Fetching images'))
+    print(f'# failures: {results.count(False)}')
+
+    evicted = evict(MAX_BYTES)
+    print(f'# thumbnails evicted: {evicted}')
+    print('Successfully created thumbnails!')
+
+
+def thumbnail_path(path: str, width: int) -> str | None:
+    '''
+    Return the saved thumbnail of the tmdb image `path` at `width`, or None.
+    '''
+
+    if not path:
+        return None
+    local = os.path.join(THUMBNAILS_DIR, f'w{width}', os.path.basename(path))
+    return local if os.path.exists(local) else None
+
+
+def evict(MAX_BYTES: int) -> int:
+    '''
+    Delete the least recently used thumbnails until they take up at most
+    `MAX_BYTES`, and return how many were deleted.
+    '''
+
+    if not os.path.isdir(THUMBNAILS_DIR):
+        return 0
+
+    files = []
+    for root, _, names in os.walk(THUMBNAILS_DIR):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            files.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+
+    total = sum(size for _, size, _ in files)
+    evicted = 0
+    for _, size, file_path in sorted(files):
+        if total <= MAX_BYTES:
+            break
+        os.remove(file_path)
+        total -= size
+        evicted += 1
+    return evicted
+
+
+def _find_images(data, images: dict):
+    '''
+    Collect the image paths of the `Poster` and `Profile URI` fields of a
+    stats page into `images`, mapping each path to its field.
+    '''
+
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in SOURCE_SIZES and isinstance(value, str) and value:
+                images.setdefault(value, key)
+            else:
+                _find_images(value, images)
+    elif isinstance(data, list):
+        for value in data:
+            _find_images(value, images)
+
+
+def _save_thumbnails(content: bytes, path: str, WIDTHS: tuple, SCALE: int):
+    with Image.open(io.BytesIO(content)) as image:
+        image = image.convert('RGB')
+        for width in WIDTHS:
+            size = min(width * SCALE, image.width)
+            thumbnail = image.resize((size, round(image.height * size / image.width)), Image.LANCZOS)
+            local = os.path.join(THUMBNAILS_DIR, f'w{width}', os.path.basename(path))
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            thumbnail.save(local + '.tmp', 'JPEG', quality=85, optimize=True)
+            os.replace(local + '.tmp', local)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 import os
+import argparse
 import streamlit as st
 import pandas as pd
 import altair as alt
-import yaml
 import math
+import sqlite3
+from stats_store import StatsStore, ALL_TIME, STATS_DIR, store_path
+from thumbnails import thumbnail_path
 
 
 COLOR_GREEN = '#2ed939'
@@ -12,18 +15,54 @@ COLOR_ORANGE = '#eba134'
 COLOR_GRAY = '#717475'
 
 
-def _read_yaml_file(file_path):
-    with open(file_path, 'r') as file:
-        try:
-            data = yaml.safe_load(file)
-            return data
-        except yaml.YAMLError as e:
-            print(f"Error reading YAML file '{file_path}': {e}")
-            return None
+def _open_store(STATS_DIR: str = STATS_DIR) -> StatsStore:
+    '''
+    Open the stats store in `STATS_DIR` read-only, or stop with a message if
+    there is no usable store.
+    '''
 
+    try:
+        return StatsStore(store_path(STATS_DIR), READ_ONLY=True)
+    except sqlite3.Error as e:
+        st.error(f'No stats to show ({e}). Run `python stats.py` first.')
+        st.stop()
 
-def _img_url(uri: str):
-    return f'https://image.tmdb.org/t/p/w500{uri}'
+
+def _read_page(page: str, STATS_DIR: str = STATS_DIR) -> dict:
+    '''
+    Read the stats of `page` from the stats store in `STATS_DIR`, without the
+    other pages, or stop with a message if it was not computed.
+    '''
+
+    store = _open_store(STATS_DIR)
+    try:
+        stats = store.get(page)
+    finally:
+        store.close()
+    if stats is None:
+        st.error(f'No stats for {page}. Run `python stats.py` first.')
+        st.stop()
+    return stats
+
+
+def _img_url(uri: str, WIDTH: int = 150):
+    '''
+    Url of the thumbnail of `uri` at `WIDTH` saved by `thumbnails.py`, served
+    by streamlit, or else of a small size of the image on tmdb.
+    '''
+
+    path = thumbnail_path(uri, WIDTH)
+    if path is not None:
+        return 'app/' + path.replace(os.sep, '/')
+    return f'https://image.tmdb.org/t/p/w185{uri}'
+
+
+def _img_src(uri: str, WIDTH: int = 150):
+    '''
+    Like `_img_url`, but a file path for local thumbnails, as `st.image` expects.
+    '''
+
+    return thumbnail_path(uri, WIDTH) or f'https://image.tmdb.org/t/p/w185{uri}'
     
 
 def _make_gallery(uris: str, NUM_COLS: int, POSTER_WIDTH: int = 70, captions: list = None, links: list = None):
@@ -33,14 +72,14 @@ def _make_gallery(uris: str, NUM_COLS: int, POSTER_WIDTH: int = 70, captions: li
         col = i % NUM_COLS
         row = i // NUM_COLS
         html_str = lambda target, img: f'<a href="{target}"><img src="{img}" style="width:{POSTER_WIDTH}px" /></a>'
-        grid[row][col].markdown(html_str(links[i] if links else '', _img_url(item)), unsafe_allow_html=True)
+        grid[row][col].markdown(html_str(links[i] if links else '', _img_url(item, POSTER_WIDTH)), unsafe_allow_html=True)
         if captions:
             grid[row][col].markdown(captions[i])
 
 
-def ui_all_time():
+def ui_all_time(STATS_DIR: str = STATS_DIR):
 
-    stats = _read_yaml_file(os.path.join('stats', 'all-time-stats.yaml'))
+    stats = _read_page(ALL_TIME, STATS_DIR)
 
     st.title('A Life in Film')
 
@@ -197,9 +236,9 @@ def ui_all_time():
         _make_gallery(directors, NUM_COLS=5, captions=directors_captions, POSTER_WIDTH=100, links=directors_links)
 
 
-def ui_for_year(year: int):
+def ui_for_year(year: int, STATS_DIR: str = STATS_DIR):
 
-    stats = _read_yaml_file(os.path.join('stats', f'{year}-stats.yaml'))
+    stats = _read_page(str(year), STATS_DIR)
 
     st.title(f'{year} in Film')
 
@@ -250,11 +289,11 @@ def ui_for_year(year: int):
     links = [milestones['First']['Movie']['URI'], milestones['Last']['Movie']['URI']]
     _, mcol1, _, mcol2, _ = st.columns(5)
     mcol1.markdown('First film')
-    mcol1.markdown(html_str(links[0] if links else '', _img_url(milestones['First']['Movie']['Poster'])), unsafe_allow_html=True)
+    mcol1.markdown(html_str(links[0] if links else '', _img_url(milestones['First']['Movie']['Poster'], 150)), unsafe_allow_html=True)
     m1, d1 = milestones['First']['Date'].split('-')
     mcol1.markdown(f'{month[m1]} {d1}')
     mcol2.markdown('Last film')
-    mcol2.markdown(html_str(links[1] if links else '', _img_url(milestones['Last']['Movie']['Poster'])), unsafe_allow_html=True)
+    mcol2.markdown(html_str(links[1] if links else '', _img_url(milestones['Last']['Movie']['Poster'], 150)), unsafe_allow_html=True)
     m2, d2 = milestones['Last']['Date'].split('-')
     mcol2.markdown(f'{month[m2]} {d2}')
 
@@ -456,19 +495,19 @@ def ui_for_year(year: int):
     hl_cols = st.columns(4)
 
     hl_cols[0].markdown('Highest average')
-    hl_cols[0].image(_img_url(stats['High_And_Lows']['Highest_Average']['Movie']['Poster']), width=150)
+    hl_cols[0].image(_img_src(stats['High_And_Lows']['Highest_Average']['Movie']['Poster'], 150), width=150)
     hl_cols[0].markdown(f"★ {stats['High_And_Lows']['Highest_Average']['Rating']}")
     
     hl_cols[1].markdown('Lowest average')
-    hl_cols[1].image(_img_url(stats['High_And_Lows']['Lowest_Average']['Movie']['Poster']), width=150)
+    hl_cols[1].image(_img_src(stats['High_And_Lows']['Lowest_Average']['Movie']['Poster'], 150), width=150)
     hl_cols[1].markdown(f"★ {stats['High_And_Lows']['Lowest_Average']['Rating']}")
 
     hl_cols[2].markdown('Most popular')
-    hl_cols[2].image(_img_url(stats['High_And_Lows']['Most_Popular']['Movie']['Poster']), width=150)
+    hl_cols[2].image(_img_src(stats['High_And_Lows']['Most_Popular']['Movie']['Poster'], 150), width=150)
     hl_cols[2].markdown(f"★ {stats['High_And_Lows']['Most_Popular']['Rating']}")
     
     hl_cols[3].markdown('Most obscure')
-    hl_cols[3].image(_img_url(stats['High_And_Lows']['Most_Obscure']['Movie']['Poster']), width=150)
+    hl_cols[3].image(_img_src(stats['High_And_Lows']['Most_Obscure']['Movie']['Poster'], 150), width=150)
     hl_cols[3].markdown(f"★ {stats['High_And_Lows']['Most_Obscure']['Rating']}")
 
     st.divider()
@@ -494,16 +533,21 @@ def ui_for_year(year: int):
 
 if __name__ == '__main__':
 
-    movies = pd.read_csv(os.path.join('generated', 'movies.csv'))
+    # Options are passed after `--`, as in `streamlit run ui.py -- --stats-dir batch/alice/stats`
+    parser = argparse.ArgumentParser(description='Show the stats computed by stats.py.')
+    parser.add_argument('--stats-dir', default=STATS_DIR, help='folder of the stats store')
+    args = parser.parse_args()
 
-    options = sorted(movies['Watched Date'].dropna().map(lambda x: int(str(x).split('-')[0])).drop_duplicates().tolist())
+    store = _open_store(args.stats_dir)
+    options = sorted(int(page) for page in store.pages() if page != ALL_TIME)
+    store.close()
     options = ['All time', *options]
     selection = st.selectbox('', options)
 
     if selection == 'All time':
-        ui_all_time()
+        ui_all_time(args.stats_dir)
     else:
-        ui_for_year(selection)
+        ui_for_year(selection, args.stats_dir)
 
     
 